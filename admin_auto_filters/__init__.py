@@ -0,0 +1,4 @@
+from django import VERSION as DJANGO_VERSION
+
+if DJANGO_VERSION < (3, 2):
+    default_app_config = 'admin_auto_filters.apps.AdminAutoFiltersConfig'
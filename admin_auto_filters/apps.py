@@ -1,5 +1,31 @@
-from django.apps import AppConfig
+from django.apps import AppConfig, apps
+from django.core.signals import setting_changed
+from django.db.models.signals import class_prepared, m2m_changed, post_delete, post_save
 
 
 class AdminAutoFiltersConfig(AppConfig):
     name = 'admin_auto_filters'
+
+    def ready(self):
+        from .cache import bump_m2m_versions, bump_model_version, get_cached_models, is_caching_enabled
+        from .filters import clear_relation_cache
+        from .instrumentation import clear_settings_cache
+        class_prepared.connect(clear_relation_cache, dispatch_uid='admin_auto_filters_class_prepared')
+        setting_changed.connect(clear_relation_cache, dispatch_uid='admin_auto_filters_setting_changed')
+        setting_changed.connect(clear_settings_cache, dispatch_uid='admin_auto_filters_instrumentation_setting')
+        if not is_caching_enabled():
+            # saves and deletes do not touch the cache unless caching is set up
+            return
+        m2m_changed.connect(bump_m2m_versions, dispatch_uid='admin_auto_filters_m2m_changed')
+        cached_models = get_cached_models()
+        if cached_models is None:
+            post_save.connect(bump_model_version, dispatch_uid='admin_auto_filters_post_save')
+            post_delete.connect(bump_model_version, dispatch_uid='admin_auto_filters_post_delete')
+            return
+        # signals are sent with the saved class as sender, proxies included
+        for model in apps.get_models():
+            if model._meta.concrete_model in cached_models:
+                uid = model._meta.label_lower
+                post_save.connect(bump_model_version, sender=model, dispatch_uid='admin_auto_filters_post_save_' + uid)
+                post_delete.connect(
+                    bump_model_version, sender=model, dispatch_uid='admin_auto_filters_post_delete_' + uid)
@@ -0,0 +1,132 @@
+"""
+Shared cache helpers. Results are cached in the cache named by the
+ADMIN_AUTO_FILTERS_CACHE setting ('default' if unset), and invalidated through
+a per-model version stamp that is bumped when a transaction saving or deleting
+rows of the model (or changing its many-to-many relations) commits. Only the
+models listed in the ADMIN_AUTO_FILTERS_CACHED_MODELS setting ('__all__' for
+every model) are tracked, and only they can be cached.
+"""
+import hashlib
+import json
+import time
+from django.apps import apps
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.exceptions import ImproperlyConfigured
+from django.db import transaction
+
+
+KEY_PREFIX = 'admin_auto_filters'
+
+
+def get_cache():
+    """Return the cache used by the package."""
+    return caches[getattr(settings, 'ADMIN_AUTO_FILTERS_CACHE', 'default')]
+
+
+def check_shared_cache():
+    """
+    Raise ImproperlyConfigured unless the cache keeps the version stamps and
+    shares them between processes, as a stale stamp would never expire.
+    """
+    cache = get_cache()
+    if isinstance(cache, (DummyCache, LocMemCache)):
+        raise ImproperlyConfigured(
+            'ETags need a cache shared by all processes; set ADMIN_AUTO_FILTERS_CACHE '
+            'to another backend than %s.' % type(cache).__name__)
+
+
+def make_digest(parts):
+    """Hash parts, a JSON serializable list of what a cached value depends on."""
+    return hashlib.md5(json.dumps(parts).encode()).hexdigest()
+
+
+def make_key(kind, parts):
+    """Return the cache key of a value of kind ('scope', 'prefetch'...) depending on parts."""
+    return '%s:%s:%s' % (KEY_PREFIX, kind, make_digest(parts))
+
+
+def _version_key(model):
+    return '%s:version:%s' % (KEY_PREFIX, model._meta.concrete_model._meta.label_lower)
+
+
+def get_model_version(model):
+    """
+    Return the current version stamp of a model. A missing (or evicted) stamp
+    is re-created from the clock, so it never collides with an older one.
+    """
+    if not is_cached_model(model):
+        raise ImproperlyConfigured(
+            'Add %s to the ADMIN_AUTO_FILTERS_CACHED_MODELS setting to cache results for it.'
+            % model._meta.concrete_model._meta.label_lower)
+    cache = get_cache()
+    key = _version_key(model)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, int(time.time() * 1000), None)
+        version = cache.get(key)
+    return version
+
+
+def get_user_scope(user):
+    """
+    Return a string identifying what user is allowed to see, so users with
+    the same permissions share cache entries.
+    """
+    if user.is_superuser:
+        return 'superuser'
+    return ','.join(sorted(user.get_all_permissions()))
+
+
+def get_cached_models():
+    """
+    Return the concrete models whose changes invalidate the cache, from the
+    ADMIN_AUTO_FILTERS_CACHED_MODELS setting, or None for all models ('__all__').
+    """
+    labels = getattr(settings, 'ADMIN_AUTO_FILTERS_CACHED_MODELS', ())
+    if labels == '__all__':
+        return None
+    return {apps.get_model(label)._meta.concrete_model for label in labels}
+
+
+def is_cached_model(model):
+    """Whether the version stamp of model is kept up to date."""
+    cached_models = get_cached_models()
+    return cached_models is None or model._meta.concrete_model in cached_models
+
+
+def is_caching_enabled():
+    """Whether the receivers bumping the version stamps are connected."""
+    return bool(getattr(settings, 'ADMIN_AUTO_FILTERS_CACHED_MODELS', ()))
+
+
+def _incr_version(model):
+    try:
+        get_cache().incr(_version_key(model))
+    except ValueError:
+        # nothing has been cached for this model yet
+        pass
+
+
+def bump_model_version(sender, using=None, **kwargs):
+    """
+    Signal receiver invalidating everything cached for the sender model, once
+    the transaction commits: a request reading the rows before then would
+    otherwise cache them under the new version.
+    """
+    transaction.on_commit(lambda: _incr_version(sender), using=using)
+
+
+def bump_m2m_versions(sender, instance, action, model, using=None, **kwargs):
+    """
+    m2m_changed receiver invalidating the models on both sides of the
+    relation, and its through model.
+    """
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    cached_models = get_cached_models()
+    for changed in {type(instance), model, sender}:
+        if cached_models is None or changed._meta.concrete_model in cached_models:
+            bump_model_version(changed, using=using)
@@ -0,0 +1,18 @@
+"""
+Database routing. The read-only queries of the package (searches, labels of
+the selected values, prefetched options) go to the database alias set on the
+filter or view (using), else to the one named by the ADMIN_AUTO_FILTERS_DATABASE
+setting, else wherever the database routers send them.
+"""
+from django.conf import settings
+
+
+def get_database(using=None):
+    """Return the database alias for read queries, or None to use the routers."""
+    return using or getattr(settings, 'ADMIN_AUTO_FILTERS_DATABASE', None)
+
+
+def route(queryset, using=None):
+    """Send queryset to the database alias for read queries, if any."""
+    alias = get_database(using)
+    return queryset if alias is None else queryset.using(alias)
@@ -1,21 +1,98 @@
+import json
+import threading
+from functools import lru_cache
 from django.contrib.admin.widgets import AutocompleteSelect as Base
 from django import forms
 from django.contrib import admin
+from django.contrib.admin.options import IncorrectLookupParameters
+from django.contrib.admin.utils import get_fields_from_path
+from django.contrib.admin.views.main import ERROR_FLAG, PAGE_VAR
+from django.core.exceptions import ImproperlyConfigured, ValidationError
+from django.db.models import Count
 from django.db.models.fields.related import ForeignObjectRel
 from django.db.models.constants import LOOKUP_SEP  # this is '__'
 from django.db.models.fields.related_descriptors import ReverseManyToOneDescriptor, ManyToManyDescriptor
-from django.forms.widgets import Media, MEDIA_TYPES, media_property
+from django.forms.widgets import Media
+from django.http import QueryDict
 from django.shortcuts import reverse
+from django.utils.functional import cached_property
+from django.utils.http import urlencode
 from django import VERSION as DJANGO_VERSION
+from .cache import get_cache, get_model_version, get_user_scope, make_key
+from .db import get_database, route
+from .instrumentation import timing
+from .mixins import BatchAutocompleteMixin, PartialRefreshMixin, ValuesAutocompleteMixin
+
+_media_lock = threading.Lock()
+
 
 class AutocompleteSelect(Base):
     def __init__(self, rel, admin_site, attrs=None, choices=(), using=None, custom_url=None):
         self.custom_url = custom_url
+        # objects for the selected values, when already fetched by the caller
+        self.selected_objects = None
         super().__init__(rel, admin_site, attrs, choices, using)
     
     def get_url(self):
         return self.custom_url if self.custom_url else super().get_url()
 
+    def build_attrs(self, base_attrs, extra_attrs=None):
+        attrs = super().build_attrs(base_attrs, extra_attrs=extra_attrs)
+        # the base class hard codes the select2 delay, let callers override it
+        if extra_attrs and 'data-ajax--delay' in extra_attrs:
+            attrs['data-ajax--delay'] = extra_attrs['data-ajax--delay']
+        return attrs
+
+    def optgroups(self, name, value, attr=None):
+        """Same as the base class, without a query if selected_objects is set."""
+        if self.selected_objects is None:
+            return super().optgroups(name, value, attr)
+        default = (None, [], 0)
+        groups = [default]
+        has_selected = False
+        if not self.is_required and not self.allow_multiple_selected:
+            default[1].append(self.create_option(name, '', '', False, 0))
+        for obj in self.selected_objects:
+            selected = (
+                str(obj.pk) in value and
+                (has_selected is False or self.allow_multiple_selected)
+            )
+            has_selected |= selected
+            label = self.choices.field.label_from_instance(obj)
+            default[1].append(self.create_option(name, obj.pk, label, selected, len(default[1])))
+        return groups
+
+
+class AutocompleteSelectMultiple(AutocompleteSelect, forms.SelectMultiple):
+    pass
+
+
+class AutocompleteValueSelect(forms.Select):
+    """
+    A select2 widget like AutocompleteSelect, for values that are not model
+    instances: its choices are the selected values, and url serves the others.
+    """
+
+    def __init__(self, url, attrs=None, choices=()):
+        self.url = url
+        super().__init__(attrs, choices)
+
+    def build_attrs(self, base_attrs, extra_attrs=None):
+        attrs = super().build_attrs(base_attrs, extra_attrs=extra_attrs)
+        attrs.setdefault('class', '')
+        # the attributes of the admin's AutocompleteSelect, read by select2
+        attrs.update({
+            'data-ajax--cache': 'true',
+            'data-ajax--delay': attrs.get('data-ajax--delay', 250),
+            'data-ajax--type': 'GET',
+            'data-ajax--url': self.url,
+            'data-theme': 'admin-autocomplete',
+            'data-allow-clear': json.dumps(not self.is_required),
+            'data-placeholder': '',
+            'class': attrs['class'] + (' ' if attrs['class'] else '') + 'admin-autocomplete',
+        })
+        return attrs
+
 
 class AutocompleteFilter(admin.SimpleListFilter):
     template = 'django-admin-autocomplete-filter/autocomplete-filter.html'
@@ -28,10 +105,33 @@ class AutocompleteFilter(admin.SimpleListFilter):
     rel_model = None
     parameter_name = None
     form_field = forms.ModelChoiceField
+    widget_class = AutocompleteSelect
+    lookup_type = 'exact'
+    # filter with pk__in=(subquery) instead of joining the relation, which keeps
+    # reverse and many-to-many lookups free of duplicate rows without distinct()
+    use_subquery = False
+    # pass the other active filters to a custom AutocompleteJsonView, which then
+    # only offers values referenced by the filtered changelist
+    scope_to_changelist = False
+    # milliseconds to wait after a keystroke before searching, and number of
+    # responses the browser keeps per filter for the lifetime of the page
+    search_delay = 250
+    client_cache_size = 50
+    # number of options for the empty term embedded in the widget, so opening
+    # the dropdown does not hit the endpoint; ranked by how many changelist
+    # rows use them if prefetch_by_usage, and cached for prefetch_cache_timeout;
+    # only for the default endpoint, whose results they stand for
+    prefetch_options = 0
+    prefetch_by_usage = False
+    prefetch_cache_timeout = 60
+    # database alias for the label, option and prefetch queries, e.g. a read
+    # replica; ADMIN_AUTO_FILTERS_DATABASE if unset
+    using = None
 
     class Media:
         js = (
             'admin/js/jquery.init.js',
+            'admin/js/autocomplete.js',
             'django-admin-autocomplete-filter/js/autocomplete_filter_qs.js',
         )
         css = {
@@ -44,55 +144,173 @@ class AutocompleteFilter(admin.SimpleListFilter):
         if self.parameter_name is None:
             self.parameter_name = self.field_name
             if self.use_pk_exact:
-                self.parameter_name += '__{}__exact'.format(self.field_pk)
-        super().__init__(request, params, model, model_admin)
-
-        if self.rel_model:
-            model = self.rel_model
-
-        if DJANGO_VERSION >= (3, 2):
-            remote_field = model._meta.get_field(self.field_name)
-        else:
-            remote_field = model._meta.get_field(self.field_name).remote_field
+                self.parameter_name += '__{}__{}'.format(self.field_pk, self.lookup_type)
+            elif self.lookup_type != 'exact':
+                self.parameter_name += '__{}'.format(self.lookup_type)
+        with timing(request, type(self), '%s.init' % self.parameter_name):
+            super().__init__(request, params, model, model_admin)
 
-        widget = AutocompleteSelect(remote_field,
-                                    model_admin.admin_site,
-                                    custom_url=self.get_autocomplete_url(request, model_admin),)
+            self._changelist_model = model
+            if self.rel_model:
+                model = self.rel_model
+
+            # the widget, form field and HTML are only built if the template asks
+            self._request = request
+            self._model = model
+            self._model_admin = model_admin
+
+            self._add_media(model_admin)
+
+            self.selected_objects = _SelectedObjects.for_request(request)
+            self.selected_objects.register(self)
+
+    @cached_property
+    def _widget(self):
+        remote_field = _get_remote_field(self._model, self.field_name)
+        url = self.get_autocomplete_url(self._request, self._model_admin)
+        if url and self.scope_to_changelist:
+            url = self.get_scoped_url(url)
+        return self.widget_class(remote_field,
+                                 self._model_admin.admin_site,
+                                 using=get_database(self.using),
+                                 custom_url=url,)
+
+    def get_scoped_url(self, url):
+        """Add the changelist model, relation and other active filters to url."""
+        scope = QueryDict(mutable=True)
+        scope['scope_model'] = self._changelist_model._meta.label_lower
+        scope['scope_lookup'] = self.get_relation_path()
+        scope['scope'] = self.get_scope_query_string()
+        return '%s%s%s' % (url, '&' if '?' in url else '?', scope.urlencode())
+
+    def get_scope_query_string(self):
+        """Return the query string of the other active filters of the changelist."""
+        params = self._request.GET.copy()
+        for name in (self.parameter_name, PAGE_VAR, ERROR_FLAG):
+            params.pop(name, None)
+        return params.urlencode()
+
+    def get_relation_path(self):
+        """Return parameter_name without its trailing pk and lookup type."""
+        path = self.parameter_name
+        for suffix in ('__{}__{}'.format(self.field_pk, self.lookup_type), '__{}'.format(self.lookup_type)):
+            if path.endswith(suffix):
+                return path[:-len(suffix)]
+        return path
+
+    @cached_property
+    def _field(self):
         form_field = self.get_form_field()
-        field = form_field(
-            queryset=self.get_queryset_for_field(model, self.field_name),
-            widget=widget,
+        return form_field(
+            queryset=route(self.get_queryset_for_field(self._model, self.field_name), self.using),
+            widget=self._widget,
             required=False,
         )
 
-        self._add_media(model_admin, widget)
-
+    @cached_property
+    def rendered_widget(self):
+        """
+        Render the widget on first access, after every filter of the changelist
+        has registered its selected values, so that labels are fetched with one
+        query per related model.
+        """
+        with timing(self._request, type(self), '%s.render' % self.parameter_name):
+            attrs = self.get_widget_attrs()
+            field = self._field
+            field.widget.selected_objects = self.selected_objects.get(field.queryset, self.get_selected_values())
+            return field.widget.render(
+                name=self.parameter_name,
+                value=self.get_selected_values(),
+                attrs=attrs
+            )
+
+    def get_widget_attrs(self):
+        """Return the HTML attributes of the widget."""
         attrs = self.widget_attrs.copy()
         attrs['id'] = 'id-%s-dal-filter' % self.parameter_name
+        attrs['data-ajax--delay'] = self.search_delay
+        attrs['data-cache-size'] = self.client_cache_size
+        if isinstance(self._model_admin, PartialRefreshMixin):
+            attrs['data-partial-refresh'] = 'true'
+        if isinstance(self._model_admin, BatchAutocompleteMixin):
+            attrs['data-batch-url'] = reverse('%s:%s' % (
+                self._model_admin.admin_site.name, self._model_admin.get_batch_url_name()))
+        if self.use_prefetched_options():
+            attrs['data-prefetched'] = json.dumps(self.get_prefetched_options())
         if self.is_placeholder_title:
             # Upper case letter P as dirty hack for bypass django2 widget force placeholder value as empty string ("")
             attrs['data-Placeholder'] = self.title
-        self.rendered_widget = field.widget.render(
-            name=self.parameter_name,
-            value=self.used_parameters.get(self.parameter_name, ''),
-            attrs=attrs
-        )
+        return attrs
+
+    def use_prefetched_options(self):
+        """
+        Whether to embed prefetched options: a custom endpoint may answer the
+        empty term with other options.
+        """
+        return bool(self.prefetch_options) and self.get_autocomplete_url(self._request, self._model_admin) is None
+
+    def get_prefetch_queryset(self):
+        """
+        Return the queryset the admin's autocomplete view searches for the
+        filter, or None if the user may not search it.
+        """
+        field = self._field
+        related_admin = self._model_admin.admin_site._registry.get(field.queryset.model)
+        if related_admin is None or not related_admin.has_view_permission(self._request):
+            return None
+        queryset = related_admin.get_queryset(self._request)
+        model_field = self._model._meta.get_field(self.field_name)
+        if not model_field.auto_created:
+            queryset = queryset.complex_filter(model_field.get_limit_choices_to())
+        return route(queryset, self.using)
+
+    def get_prefetched_options(self):
+        """
+        Return the first prefetch_options options for the empty term, as the
+        admin's autocomplete view would.
+        """
+        field = self._field
+        queryset = self.get_prefetch_queryset()
+        if queryset is None:
+            return []
+        models = [queryset.model, self._changelist_model] if self.prefetch_by_usage else [queryset.model]
+        parts = [
+            '%s.%s' % (type(self).__module__, type(self).__qualname__),
+            self._changelist_model._meta.label_lower,
+            self.parameter_name,
+            str(self.title),
+            self.prefetch_options,
+            self.prefetch_by_usage,
+            [get_model_version(model) for model in models],
+            get_user_scope(self._request.user),
+        ]
+        key = make_key('prefetch', parts)
+        cache = get_cache()
+        options = cache.get(key)
+        if options is None:
+            if self.prefetch_by_usage:
+                path = self.get_relation_path()
+                usage = (route(self._changelist_model._default_manager.all(), self.using)
+                         .filter(**{'%s__isnull' % path: False})
+                         .values_list(path).annotate(count=Count('pk')).order_by('-count'))
+                ranked = [pk for pk, count in usage[:self.prefetch_options]]
+                objects = {obj.pk: obj for obj in queryset.filter(pk__in=ranked)}
+                objects = [objects[pk] for pk in ranked if pk in objects]
+            else:
+                objects = queryset[:self.prefetch_options]
+            options = [{'id': str(obj.pk), 'text': str(field.label_from_instance(obj))} for obj in objects]
+            cache.set(key, options, self.prefetch_cache_timeout)
+        return options
+
+    def get_selected_values(self):
+        """Return the selected values as a list of strings."""
+        value = self.used_parameters.get(self.parameter_name, '')
+        return [str(value)] if value else []
 
     @staticmethod
     def get_queryset_for_field(model, name):
-        try:
-            field_desc = getattr(model, name)
-        except AttributeError:
-            field_desc = model._meta.get_field(name)
-        if isinstance(field_desc, ManyToManyDescriptor):
-            related_model = field_desc.rel.related_model if field_desc.reverse else field_desc.rel.model
-        elif isinstance(field_desc, ReverseManyToOneDescriptor):
-            related_model = field_desc.rel.related_model  # look at field_desc.related_manager_cls()?
-        elif isinstance(field_desc, ForeignObjectRel):
-            # includes ManyToOneRel, ManyToManyRel
-            # also includes OneToOneRel - not sure how this would be used
-            related_model = field_desc.related_model
-        else:
+        field_desc, related_model = _get_field_desc(model, name)
+        if related_model is None:
             # primarily for ForeignKey/ForeignKeyDeferredAttribute
             # also includes ForwardManyToOneDescriptor, ForwardOneToOneDescriptor, ReverseOneToOneDescriptor
             return field_desc.get_queryset()
@@ -102,19 +320,35 @@ class AutocompleteFilter(admin.SimpleListFilter):
         """Return the type of form field to be used."""
         return self.form_field
 
-    def _add_media(self, model_admin, widget):
-
-        if not hasattr(model_admin, 'Media'):
-            model_admin.__class__.Media = type('Media', (object,), dict())
-            model_admin.__class__.media = media_property(model_admin.__class__)
+    def _add_media(self, model_admin):
+        """
+        Add the media of this filter class to the model admin's media. This
+        only changes the admin class the first time a filter class is used
+        with it; later requests just check that it is already registered.
+        The widget media is added on access, as its select2 translation
+        depends on the active language.
+        """
+        admin_class = type(model_admin)
+        if type(self) in admin_class.__dict__.get('_autocomplete_filter_classes', ()):
+            return
 
         def _get_media(obj):
             return Media(media=getattr(obj, 'Media', None))
 
-        media = _get_media(model_admin) + widget.media + _get_media(AutocompleteFilter) + _get_media(self)
-
-        for name in MEDIA_TYPES:
-            setattr(model_admin.Media, name, getattr(media, "_" + name))
+        with _media_lock:
+            registered = admin_class.__dict__.get('_autocomplete_filter_classes', frozenset())
+            if type(self) in registered:
+                return
+            extra = admin_class.__dict__.get('_autocomplete_filter_media', Media())
+            extra = extra + _get_media(AutocompleteFilter) + _get_media(self)
+            base = admin_class.__dict__.get('_autocomplete_filter_base_media', admin_class.media)
+            admin_class._autocomplete_filter_base_media = base
+            admin_class._autocomplete_filter_media = extra
+            # the media of AutocompleteSelect does not depend on the relation
+            admin_class.media = property(
+                lambda obj: base.__get__(obj) + AutocompleteSelect(None, None).media + extra)
+            # registered last, so the fast path never sees a class without its media
+            admin_class._autocomplete_filter_classes = registered | {type(self)}
 
     def has_output(self):
         return True
@@ -122,9 +356,19 @@ class AutocompleteFilter(admin.SimpleListFilter):
     def lookups(self, request, model_admin):
         return ()
 
+    def get_lookup(self):
+        """Return the keyword arguments used to filter the changelist."""
+        return {self.parameter_name: self.value()}
+
     def queryset(self, request, queryset):
         if self.value():
-            return queryset.filter(**{self.parameter_name: self.value()})
+            with timing(request, type(self), '%s.queryset' % self.parameter_name):
+                lookup = self.get_lookup()
+                if self.use_subquery:
+                    # semi-join: multi-valued relations cannot duplicate rows
+                    subquery = queryset.model._base_manager.filter(**lookup).values('pk')
+                    return queryset.filter(pk__in=subquery)
+                return queryset.filter(**lookup)
         else:
             return queryset
     
@@ -136,27 +380,256 @@ class AutocompleteFilter(admin.SimpleListFilter):
         return None
 
 
-def generate_choice_field(label_item):
+class AutocompleteFilterMultiple(AutocompleteFilter):
+    """
+    An AutocompleteFilter matching any of several values, passed comma-joined
+    in one parameter (e.g. ?artist__pk__in=1,2) and applied with one __in lookup.
+    """
+    form_field = forms.ModelMultipleChoiceField
+    widget_class = AutocompleteSelectMultiple
+    lookup_type = 'in'
+
+    def get_selected_values(self):
+        value = self.used_parameters.get(self.parameter_name, '')
+        return [item for item in str(value).split(',') if item]
+
+    def get_lookup(self):
+        name = self.parameter_name
+        if not name.endswith(LOOKUP_SEP + 'in'):
+            name += LOOKUP_SEP + 'in'
+        return {name: self.get_selected_values()}
+
+    def queryset(self, request, queryset):
+        try:
+            return super().queryset(request, queryset)
+        except (ValueError, ValidationError) as e:
+            # e.g. ?artist__pk__in=abc,1
+            raise IncorrectLookupParameters(e)
+
+
+class AutocompleteValueFilter(AutocompleteFilter):
+    """
+    An autocomplete filter on a plain (non-relational) column of the changelist
+    model, e.g. field_name = 'city', or a path through relations such as
+    'address__city'. Options come from the AutocompleteValuesView of a
+    ValuesAutocompleteMixin model admin, which searches the distinct values of
+    the column with search_lookup; with snapshot_timeout, up to snapshot_limit
+    distinct values are cached and searched in memory instead.
+    """
+    use_pk_exact = False
+    form_field = forms.ChoiceField
+    widget_class = AutocompleteValueSelect
+    search_lookup = 'istartswith'
+    snapshot_timeout = None
+    snapshot_limit = 10000
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        # set on the class, so ModelAdmin.lookup_allowed() accepts paths through
+        # relations, and the values endpoint finds the filter
+        if cls.parameter_name is None and cls.field_name:
+            cls.parameter_name = cls.field_name
+            if cls.lookup_type != 'exact':
+                cls.parameter_name += '__{}'.format(cls.lookup_type)
+
+    @cached_property
+    def _widget(self):
+        url = self.get_autocomplete_url(self._request, self._model_admin)
+        if url is None:
+            if not isinstance(self._model_admin, ValuesAutocompleteMixin):
+                raise ImproperlyConfigured(
+                    '%s requires a model admin with ValuesAutocompleteMixin, '
+                    'or get_autocomplete_url().' % type(self).__name__)
+            params = {'field': self.parameter_name}
+            if self.scope_to_changelist:
+                params['scope'] = self.get_scope_query_string()
+            url = '%s?%s' % (
+                reverse('%s:%s' % (self._model_admin.admin_site.name, self._model_admin.get_values_url_name())),
+                urlencode(params),
+            )
+        return self.widget_class(url)
+
+    @cached_property
+    def _field(self):
+        choices = [('', '')] + [(value, value) for value in self.get_selected_values()]
+        return self.get_form_field()(choices=choices, widget=self._widget, required=False)
+
+    @cached_property
+    def rendered_widget(self):
+        with timing(self._request, type(self), '%s.render' % self.parameter_name):
+            return self._field.widget.render(
+                name=self.parameter_name,
+                value=self.get_selected_values(),
+                attrs=self.get_widget_attrs(),
+            )
+
+    def use_prefetched_options(self):
+        # the scoped endpoint answers the empty term with the changelist's values
+        return super().use_prefetched_options() and not self.scope_to_changelist
+
+    def get_prefetched_options(self):
+        """Return the first prefetch_options values, or the most used ones if prefetch_by_usage."""
+        path = self.field_name
+        models = {field.model for field in get_fields_from_path(self._changelist_model, path)}
+        parts = [
+            '%s.%s' % (type(self).__module__, type(self).__qualname__),
+            self._changelist_model._meta.label_lower,
+            self.parameter_name,
+            self.prefetch_options,
+            self.prefetch_by_usage,
+            sorted(get_model_version(model) for model in models | {self._changelist_model}),
+            get_user_scope(self._request.user),
+        ]
+        key = make_key('prefetch', parts)
+        cache = get_cache()
+        options = cache.get(key)
+        if options is None:
+            # the model admin queryset, as searched by AutocompleteValuesView
+            rows = route(self._model_admin.get_queryset(self._request), self.using)
+            rows = rows.filter(**{'%s__isnull' % path: False})
+            if self.prefetch_by_usage:
+                usage = rows.values_list(path).annotate(count=Count('pk')).order_by('-count', path)
+                values = [value for value, count in usage[:self.prefetch_options]]
+            else:
+                values = rows.order_by(path).values_list(path, flat=True).distinct()[:self.prefetch_options]
+            options = [{'id': str(value), 'text': str(value)} for value in values]
+            cache.set(key, options, self.prefetch_cache_timeout)
+        return options
+
+    def queryset(self, request, queryset):
+        try:
+            return super().queryset(request, queryset)
+        except (ValueError, ValidationError) as e:
+            # e.g. a number column filtered by text
+            raise IncorrectLookupParameters(e)
+
+
+@lru_cache(maxsize=None)
+def generate_choice_field(label_item, base=forms.ModelChoiceField):
     """
     Create a ModelChoiceField variant with a modified label_from_instance.
     Note that label_item can be a callable, or a model field, or a model callable.
+    Classes are cached, so each distinct label_item creates a single class.
     """
-    class LabelledModelChoiceField(forms.ModelChoiceField):
+    if callable(label_item):
+        get_label = label_item
+    else:
+        attr_name = str(label_item)
+
+        def get_label(obj):
+            try:
+                attr = getattr(obj, attr_name)
+            except AttributeError:
+                raise ValueError('Invalid label_item specified: %s' % attr_name)
+            return attr() if callable(attr) else attr
+
+    class LabelledModelChoiceField(base):
         def label_from_instance(self, obj):
-            if callable(label_item):
-                value = label_item(obj)
-            elif hasattr(obj, str(label_item)):
-                attr = getattr(obj, label_item)
-                if callable(attr):
-                    value = attr()
-                else:
-                    value = attr
-            else:
-                raise ValueError('Invalid label_item specified: %s' % str(label_item))
-            return value
+            return get_label(obj)
     return LabelledModelChoiceField
 
 
+class _SelectedObjects:
+    """
+    Per-request registry of the values selected in autocomplete filters, so
+    their objects are fetched with one query per related model.
+    """
+
+    def __init__(self):
+        self.filters = []
+        self.pending = {}
+        self.objects = {}
+
+    @classmethod
+    def for_request(cls, request):
+        registry = getattr(request, '_autocomplete_filter_selected_objects', None)
+        if registry is None:
+            registry = request._autocomplete_filter_selected_objects = cls()
+        return registry
+
+    @staticmethod
+    def _key(queryset):
+        # restricted querysets are not shared with other filters
+        if queryset.query.has_filters():
+            return None
+        return queryset.model, queryset.db
+
+    @staticmethod
+    def _clean(queryset, values):
+        cleaned = []
+        for value in values:
+            try:
+                cleaned.append(str(queryset.model._meta.pk.to_python(value)))
+            except ValidationError:
+                continue
+        return cleaned
+
+    def register(self, spec):
+        """Register a filter; its values are collected when a label is first needed."""
+        self.filters.append(spec)
+
+    def _collect(self):
+        while self.filters:
+            spec = self.filters.pop()
+            queryset = getattr(spec._field, 'queryset', None)
+            if queryset is None:
+                # the values of AutocompleteValueFilter are not model instances
+                continue
+            key = self._key(queryset)
+            if key is not None:
+                values = self._clean(queryset, spec.get_selected_values())
+                self.pending.setdefault(key, set()).update(values)
+
+    def get(self, queryset, values):
+        """Return the objects for values, or None if they were not registered."""
+        self._collect()
+        key = self._key(queryset)
+        if key is None or key not in self.pending:
+            return None
+        objects = self.objects.setdefault(key, {})
+        pending = self.pending[key] - set(objects)
+        if pending:
+            for obj in queryset.filter(pk__in=pending):
+                objects[str(obj.pk)] = obj
+            self.pending[key] = set()
+        return [objects[value] for value in self._clean(queryset, values) if value in objects]
+
+
+# The relation metadata below is resolved once per (model, name) and cached
+# until the app registry changes, see clear_relation_cache().
+
+@lru_cache(maxsize=None)
+def _get_field_desc(model, name):
+    """
+    Return (field_desc, related_model) for get_queryset_for_field, where
+    related_model is None when field_desc provides get_queryset() itself.
+    """
+    try:
+        field_desc = getattr(model, name)
+    except AttributeError:
+        field_desc = model._meta.get_field(name)
+    if isinstance(field_desc, ManyToManyDescriptor):
+        related_model = field_desc.rel.related_model if field_desc.reverse else field_desc.rel.model
+    elif isinstance(field_desc, ReverseManyToOneDescriptor):
+        related_model = field_desc.rel.related_model  # look at field_desc.related_manager_cls()?
+    elif isinstance(field_desc, ForeignObjectRel):
+        # includes ManyToOneRel, ManyToManyRel
+        # also includes OneToOneRel - not sure how this would be used
+        related_model = field_desc.related_model
+    else:
+        related_model = None
+    return field_desc, related_model
+
+
+@lru_cache(maxsize=None)
+def _get_remote_field(model, field_name):
+    """Return the relation passed to the AutocompleteSelect widget."""
+    if DJANGO_VERSION >= (3, 2):
+        return model._meta.get_field(field_name)
+    return model._meta.get_field(field_name).remote_field
+
+
+@lru_cache(maxsize=None)
 def _get_rel_model(model, parameter_name):
     """
     A way to calculate the model for a parameter_name that includes LOOKUP_SEP.
@@ -171,12 +644,26 @@ def _get_rel_model(model, parameter_name):
         return rel_model
 
 
-def AutocompleteFilterFactory(title, base_parameter_name, viewname='', use_pk_exact=False, label_by=str):
+def clear_relation_cache(sender=None, setting=None, **kwargs):
+    """
+    Clear the cached relation metadata. Connected to class_prepared and
+    setting_changed, which are sent when the app registry changes.
+    """
+    if setting is not None and setting != 'INSTALLED_APPS':
+        return
+    _get_field_desc.cache_clear()
+    _get_remote_field.cache_clear()
+    _get_rel_model.cache_clear()
+
+
+def AutocompleteFilterFactory(title, base_parameter_name, viewname='', use_pk_exact=False, label_by=str,
+                              use_subquery=False, multiple=False, scope_to_changelist=False, using=None):
     """
     An autocomplete widget filter with a customizable title. Use like this:
         AutocompleteFilterFactory('My title', 'field_name')
         AutocompleteFilterFactory('My title', 'fourth__third__second__first')
-    Be sure to include distinct in the model admin get_queryset() if the second form is used.
+    Be sure to include distinct in the model admin get_queryset() if the second form is used,
+    or pass use_subquery=True.
     Assumes: parameter_name == f'fourth__third__second__{field_name}'
         * title: The title for the filter.
         * base_parameter_name: The field to use for the filter.
@@ -184,6 +671,11 @@ def AutocompleteFilterFactory(title, base_parameter_name, viewname='', use_pk_ex
         * use_pk_exact: Whether to use '__pk__exact' in the parameter name when possible.
         * label_by: How to generate the static label for the widget - a callable, the name
           of a model callable, or the name of a model field.
+        * use_subquery: Whether to filter with a pk__in subquery instead of a join.
+        * multiple: Whether to allow selecting several values (AutocompleteFilterMultiple).
+        * scope_to_changelist: Whether to only offer values present in the filtered changelist
+          (requires a custom view).
+        * using: The database alias for the label and option queries.
     """
 
     class NewMetaFilter(type(AutocompleteFilter)):
@@ -192,19 +684,27 @@ def AutocompleteFilterFactory(title, base_parameter_name, viewname='', use_pk_ex
         def __new__(cls, name, bases, attrs):
             super_new = super().__new__(cls, name, bases, attrs)
             super_new.use_pk_exact = use_pk_exact
+            super_new.use_subquery = use_subquery
+            super_new.scope_to_changelist = scope_to_changelist
+            super_new.using = using
             field_names = str(base_parameter_name).split(LOOKUP_SEP)
             super_new.field_name = field_names[-1]
             super_new.parameter_name = base_parameter_name
             if len(field_names) <= 1 and super_new.use_pk_exact:
-                super_new.parameter_name += '__{}__exact'.format(super_new.field_pk)
+                super_new.parameter_name += '__{}__{}'.format(super_new.field_pk, super_new.lookup_type)
+            elif super_new.lookup_type != 'exact':
+                super_new.parameter_name += '__{}'.format(super_new.lookup_type)
             return super_new
 
-    class NewFilter(AutocompleteFilter, metaclass=NewMetaFilter):
+    base = AutocompleteFilterMultiple if multiple else AutocompleteFilter
+
+    class NewFilter(base, metaclass=NewMetaFilter):
         """An autogenerated autocomplete filter class."""
 
+        form_field = generate_choice_field(label_by, base.form_field)
+
         def __init__(self, request, params, model, model_admin):
             self.rel_model = _get_rel_model(model, base_parameter_name)
-            self.form_field = generate_choice_field(label_by)
             super().__init__(request, params, model, model_admin)
             self.title = title
 
@@ -0,0 +1,96 @@
+"""
+Optional timing of the filters and autocomplete views. With the
+ADMIN_AUTO_FILTERS_INSTRUMENTATION setting enabled, the wall time and number of
+queries of each phase are sent with the phase_timed signal, logged to the
+'admin_auto_filters.timing' logger at DEBUG level, and added to the
+Server-Timing header of the response by ServerTimingMiddleware. When disabled,
+timing() returns a shared no-op context manager.
+"""
+import logging
+import time
+from contextlib import ExitStack, nullcontext
+from functools import lru_cache
+from django.conf import settings
+from django.db import connections
+from django.dispatch import Signal
+
+
+logger = logging.getLogger('admin_auto_filters.timing')
+
+# sent with sender=<filter or view class>, name, duration (in seconds), queries, request
+phase_timed = Signal()
+
+TIMINGS_ATTR = '_admin_auto_filters_timings'
+
+_disabled = nullcontext()
+
+
+@lru_cache(maxsize=None)
+def is_enabled():
+    return bool(getattr(settings, 'ADMIN_AUTO_FILTERS_INSTRUMENTATION', False))
+
+
+def clear_settings_cache(setting=None, **kwargs):
+    """Receiver for setting_changed."""
+    if setting == 'ADMIN_AUTO_FILTERS_INSTRUMENTATION':
+        is_enabled.cache_clear()
+
+
+def timing(request, sender, name):
+    """Return a context manager timing the phase called name of sender."""
+    if not is_enabled():
+        return _disabled
+    return _Timer(request, sender, name)
+
+
+class _Timer:
+    def __init__(self, request, sender, name):
+        self.request = request
+        self.sender = sender
+        self.name = name
+        self.queries = 0
+
+    def __enter__(self):
+        self.stack = ExitStack()
+        for connection in connections.all():
+            self.stack.enter_context(connection.execute_wrapper(self.count_query))
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        duration = time.perf_counter() - self.start
+        self.stack.close()
+        logger.debug('%s: %.2f ms, %d queries', self.name, duration * 1000, self.queries)
+        if self.request is not None:
+            timings = getattr(self.request, TIMINGS_ATTR, None)
+            if timings is None:
+                timings = []
+                setattr(self.request, TIMINGS_ATTR, timings)
+            timings.append((self.name, duration, self.queries))
+        phase_timed.send(
+            sender=self.sender, name=self.name, duration=duration, queries=self.queries, request=self.request,
+        )
+
+    def count_query(self, execute, sql, params, many, context):
+        self.queries += 1
+        return execute(sql, params, many, context)
+
+
+class ServerTimingMiddleware:
+    """Add the phases timed during the request to its Server-Timing header."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        timings = getattr(request, TIMINGS_ATTR, None)
+        if timings:
+            entries = [
+                '%s;dur=%.3f;desc="%d queries"' % (name, duration * 1000, queries)
+                for name, duration, queries in timings
+            ]
+            if response.has_header('Server-Timing'):
+                entries.insert(0, response['Server-Timing'])
+            response['Server-Timing'] = ', '.join(entries)
+        return response
@@ -0,0 +1,38 @@
+"""
+Create the supporting tables of the search backends of the autocomplete views,
+and fill them. Existing tables are kept, and refreshed.
+"""
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from admin_auto_filters.search import get_indexed_views
+
+
+class Command(BaseCommand):
+    help = 'Create and fill the search index tables of the autocomplete views.'
+    action = 'build'
+
+    def add_arguments(self, parser):
+        parser.add_argument('models', nargs='*', metavar='app_label.ModelName',
+                            help='Only index these models (default: all the models searched through an index).')
+        parser.add_argument('--database', default=DEFAULT_DB_ALIAS,
+                            help='Database to index (default: "%s").' % DEFAULT_DB_ALIAS)
+
+    def handle(self, *args, **options):
+        using = options['database']
+        labels = {label.lower() for label in options['models']}
+        pairs = [
+            (backend, model_admin) for backend, model_admin in get_indexed_views()
+            if not labels or model_admin.model._meta.label_lower in labels
+        ]
+        if labels and not pairs:
+            raise CommandError('No autocomplete view searches %s through an index.' % ', '.join(options['models']))
+        for backend, model_admin in pairs:
+            label = model_admin.model._meta.label
+            if not backend.supports(connections[using]):
+                self.stdout.write('Skipping %s: %s does not run on database "%s".' % (
+                    label, type(backend).__name__, using))
+                continue
+            with transaction.atomic(using=using):
+                getattr(backend, self.action)(model_admin, using)
+            if options['verbosity'] >= 1:
+                self.stdout.write('%s: %s (%s).' % (self.action.capitalize(), label, type(backend).__name__))
@@ -0,0 +1,10 @@
+"""
+Rebuild the supporting tables of the search backends of the autocomplete views
+from the model tables, e.g. after changes made with the triggers disabled.
+"""
+from .build_search_index import Command as BuildCommand
+
+
+class Command(BuildCommand):
+    help = 'Rebuild the search index tables of the autocomplete views from the model tables.'
+    action = 'refresh'
@@ -0,0 +1,63 @@
+from django.template.response import TemplateResponse
+from django.urls import path
+from django.utils.cache import patch_vary_headers
+from .views import AutocompleteBatchView, AutocompleteValuesView
+
+
+FRAGMENT_HEADER = 'X-Changelist-Fragment'
+
+
+class PartialRefreshMixin:
+    """
+    ModelAdmin mixin enabling partial refreshes: when an autocomplete filter
+    changes, the page fetches the new changelist and swaps #changelist in place
+    instead of reloading. Those requests get a fragment response, which skips
+    rendering the parts of the page that are kept.
+    """
+    fragment_template = 'django-admin-autocomplete-filter/change_list_fragment.html'
+
+    def changelist_view(self, request, extra_context=None):
+        response = super().changelist_view(request, extra_context)
+        if not isinstance(response, TemplateResponse) or response.is_rendered:
+            return response
+        patch_vary_headers(response, (FRAGMENT_HEADER,))
+        if request.META.get('HTTP_' + FRAGMENT_HEADER.upper().replace('-', '_')):
+            base = response.resolve_template(response.template_name)
+            response.context_data['fragment_base_template'] = base.template
+            response.template_name = self.fragment_template
+        return response
+
+
+class BatchAutocompleteMixin:
+    """
+    ModelAdmin mixin adding a batch endpoint for the autocomplete filters of
+    its changelist: searches issued by several filters at once are sent in one
+    request instead of one request per filter.
+    """
+    batch_view_class = AutocompleteBatchView
+
+    def get_batch_url_name(self):
+        return '%s_%s_autocomplete_batch' % (self.model._meta.app_label, self.model._meta.model_name)
+
+    def get_urls(self):
+        view = self.batch_view_class.as_view(admin_site=self.admin_site)
+        return [
+            path('autocomplete_batch/', self.admin_site.admin_view(view), name=self.get_batch_url_name()),
+        ] + super().get_urls()
+
+
+class ValuesAutocompleteMixin:
+    """
+    ModelAdmin mixin adding the endpoint searching the distinct values of the
+    columns of its AutocompleteValueFilter filters.
+    """
+    values_view_class = AutocompleteValuesView
+
+    def get_values_url_name(self):
+        return '%s_%s_autocomplete_values' % (self.model._meta.app_label, self.model._meta.model_name)
+
+    def get_urls(self):
+        view = self.values_view_class.as_view(model_admin=self)
+        return [
+            path('autocomplete_values/', self.admin_site.admin_view(view), name=self.get_values_url_name()),
+        ] + super().get_urls()
@@ -0,0 +1,280 @@
+"""
+Search backends for AutocompleteJsonView. The default backend is the model
+admin's get_search_results() (icontains over search_fields), which scans the
+table. The index backends keep the searched text columns in a supporting
+table, kept up to date by triggers, and answer each term with an index lookup:
+
+* SQLiteFTS5Backend: an external content FTS5 table, matching word prefixes.
+* PostgresSearchBackend: a tsvector column with a GIN index (mode='fts',
+  matching word prefixes), or a text column with a pg_trgm GIN index
+  (mode='trigram', matching substrings like icontains).
+
+The supporting tables are created with the build_search_index management
+command, and rebuilt from the model tables with refresh_search_index. On other
+databases than the backend's, the model admin search is used.
+"""
+import re
+from django.core.exceptions import FieldDoesNotExist
+from django.db import connections, models
+from django.db.backends.utils import truncate_name
+from django.db.models.expressions import RawSQL
+from django.urls import URLResolver, get_resolver
+from .views import AutocompleteJsonView, _unwrap_view
+
+
+class SearchBackend:
+    """Search with the model admin, on any database."""
+
+    # database vendor the backend works on, None for any
+    vendor = None
+
+    def supports(self, connection):
+        return self.vendor is None or connection.vendor == self.vendor
+
+    def get_search_results(self, request, model_admin, queryset, term):
+        """Return the queryset filtered by term, and whether it may have duplicates."""
+        return model_admin.get_search_results(request, queryset, term)
+
+    def build(self, model_admin, using):
+        """Create the structures the backend searches, then fill them."""
+
+    def refresh(self, model_admin, using):
+        """Rebuild the structures the backend searches from the model table."""
+
+
+class IndexTableBackend(SearchBackend):
+    """
+    Base class of the backends searching a supporting table, named after the
+    model table, whose rows are the primary keys of the model rows.
+    fields are the columns indexed; by default the text fields of the model
+    among the model admin's search_fields (fields of related models are not
+    searched).
+    """
+
+    def __init__(self, fields=None):
+        self.fields = fields
+
+    def get_fields(self, model_admin):
+        opts = model_admin.model._meta
+        if self.fields is not None:
+            fields = [opts.get_field(name) for name in self.fields]
+        else:
+            fields = []
+            for name in model_admin.search_fields:
+                try:
+                    field = opts.get_field(name.lstrip('^=@'))
+                except FieldDoesNotExist:
+                    # a path through a relation
+                    continue
+                if isinstance(field, (models.CharField, models.TextField)) and not field.is_relation:
+                    fields.append(field)
+        if not fields:
+            raise ValueError('%s has no text fields to index.' % model_admin.model._meta.label)
+        return fields
+
+    def get_table_name(self, model, connection):
+        return truncate_name('%s_search' % model._meta.db_table, connection.ops.max_name_length())
+
+    def get_terms(self, term):
+        return term.split()
+
+    def get_search_results(self, request, model_admin, queryset, term):
+        terms = self.get_terms(term)
+        if not terms:
+            return queryset, False
+        connection = connections[queryset.db]
+        sql, params = self.get_match_sql(self.get_table_name(model_admin.model, connection), terms, connection)
+        return queryset.filter(pk__in=RawSQL(sql, params)), False
+
+    def get_match_sql(self, table, terms, connection):
+        """Return the SQL selecting the primary keys of the rows matching terms, and its parameters."""
+        raise NotImplementedError
+
+    def execute(self, connection, statements):
+        with connection.cursor() as cursor:
+            for statement in statements:
+                cursor.execute(statement)
+
+
+class SQLiteFTS5Backend(IndexTableBackend):
+    """
+    Search an FTS5 table. Each word of the term matches the beginning of a
+    word of the indexed fields; with tokenize='trigram' (SQLite 3.34+), any
+    part of them. The model must have an integer primary key.
+    """
+
+    vendor = 'sqlite'
+
+    def __init__(self, fields=None, tokenize='unicode61'):
+        super().__init__(fields)
+        self.tokenize = tokenize
+
+    def get_terms(self, term):
+        # FTS5 strings are double quoted, with double quotes doubled
+        return ['"%s"' % word.replace('"', '""') for word in term.split()]
+
+    def get_match_sql(self, table, terms, connection):
+        quoted = connection.ops.quote_name(table)
+        if self.tokenize == 'trigram':
+            query = ' '.join(terms)
+        else:
+            query = ' '.join(word + '*' for word in terms)
+        return 'SELECT rowid FROM %s WHERE %s MATCH %%s' % (quoted, quoted), [query]
+
+    def build(self, model_admin, using):
+        connection = connections[using]
+        qn = connection.ops.quote_name
+        model = model_admin.model
+        table = self.get_table_name(model, connection)
+        columns = [field.column for field in self.get_fields(model_admin)]
+        names = ', '.join(qn(column) for column in columns)
+
+        def values(row):
+            return ', '.join('%s.%s' % (row, qn(column)) for column in columns)
+
+        def delete(row):
+            return 'INSERT INTO %s(%s, rowid, %s) VALUES (\'delete\', %s.%s, %s);' % (
+                qn(table), qn(table), names, row, qn(model._meta.pk.column), values(row))
+
+        def insert(row):
+            return 'INSERT INTO %s(rowid, %s) VALUES (%s.%s, %s);' % (
+                qn(table), names, row, qn(model._meta.pk.column), values(row))
+
+        self.execute(connection, [
+            'CREATE VIRTUAL TABLE IF NOT EXISTS %s USING fts5(%s, content=\'%s\', content_rowid=\'%s\', '
+            'tokenize=\'%s\')' % (qn(table), names, model._meta.db_table, model._meta.pk.column, self.tokenize),
+            'CREATE TRIGGER IF NOT EXISTS %s AFTER INSERT ON %s BEGIN %s END' % (
+                qn(table + '_ai'), qn(model._meta.db_table), insert('new')),
+            'CREATE TRIGGER IF NOT EXISTS %s AFTER DELETE ON %s BEGIN %s END' % (
+                qn(table + '_ad'), qn(model._meta.db_table), delete('old')),
+            'CREATE TRIGGER IF NOT EXISTS %s AFTER UPDATE ON %s BEGIN %s %s END' % (
+                qn(table + '_au'), qn(model._meta.db_table), delete('old'), insert('new')),
+        ])
+        self.refresh(model_admin, using)
+
+    def refresh(self, model_admin, using):
+        connection = connections[using]
+        quoted = connection.ops.quote_name(self.get_table_name(model_admin.model, connection))
+        self.execute(connection, [
+            'INSERT INTO %s(%s) VALUES (\'rebuild\')' % (quoted, quoted),
+            'INSERT INTO %s(%s) VALUES (\'optimize\')' % (quoted, quoted),
+        ])
+
+
+class PostgresSearchBackend(IndexTableBackend):
+    """
+    Search a table of documents made of the indexed fields. With mode='fts',
+    each word of the term matches the beginning of a word of the document,
+    using the text search configuration config; with mode='trigram', any part
+    of it, case-insensitively (this needs the pg_trgm extension, created by
+    build_search_index if missing).
+    """
+
+    vendor = 'postgresql'
+
+    def __init__(self, fields=None, mode='fts', config='simple'):
+        if mode not in ('fts', 'trigram'):
+            raise ValueError("mode must be 'fts' or 'trigram'.")
+        if not re.match(r'^\w+$', config):
+            raise ValueError('Invalid text search configuration: %r.' % config)
+        super().__init__(fields)
+        self.mode = mode
+        self.config = config
+
+    def get_terms(self, term):
+        if self.mode == 'trigram':
+            return term.split()
+        # the words of the term, as prefixes in to_tsquery() syntax
+        return ["'%s':*" % word for word in re.findall(r'\w+', term)]
+
+    def get_match_sql(self, table, terms, connection):
+        quoted = connection.ops.quote_name(table)
+        if self.mode == 'trigram':
+            patterns = ['%%%s%%' % re.sub(r'([\\%_])', r'\\\1', word) for word in terms]
+            where = ' AND '.join(['"document" ILIKE %s'] * len(patterns))
+            return 'SELECT "id" FROM %s WHERE %s' % (quoted, where), patterns
+        return (
+            'SELECT "id" FROM %s WHERE "document" @@ to_tsquery(%%s::regconfig, %%s)' % quoted,
+            [self.config, ' & '.join(terms)],
+        )
+
+    def get_document_sql(self, model_admin, connection, row=None):
+        qn = connection.ops.quote_name
+        columns = [
+            qn(field.column) if row is None else '%s.%s' % (row, qn(field.column))
+            for field in self.get_fields(model_admin)
+        ]
+        document = "concat_ws(' ', %s)" % ', '.join(columns)
+        if self.mode == 'trigram':
+            return document
+        return "to_tsvector('%s'::regconfig, %s)" % (self.config, document)
+
+    def build(self, model_admin, using):
+        connection = connections[using]
+        qn = connection.ops.quote_name
+        model = model_admin.model
+        table = self.get_table_name(model, connection)
+        pk = model._meta.pk
+        statements = []
+        if self.mode == 'trigram':
+            statements.append('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+        statements += [
+            'CREATE TABLE IF NOT EXISTS %s ("id" %s PRIMARY KEY REFERENCES %s (%s) ON DELETE CASCADE, '
+            '"document" %s NOT NULL)' % (
+                qn(table), pk.rel_db_type(connection), qn(model._meta.db_table), qn(pk.column),
+                'text' if self.mode == 'trigram' else 'tsvector'),
+            'CREATE INDEX IF NOT EXISTS %s ON %s USING gin ("document"%s)' % (
+                qn(table + '_document'), qn(table), ' gin_trgm_ops' if self.mode == 'trigram' else ''),
+            'CREATE OR REPLACE FUNCTION %s() RETURNS trigger AS $$ BEGIN '
+            'INSERT INTO %s ("id", "document") VALUES (NEW.%s, %s) '
+            'ON CONFLICT ("id") DO UPDATE SET "document" = EXCLUDED."document"; '
+            'RETURN NULL; END $$ LANGUAGE plpgsql' % (
+                qn(table + '_sync'), qn(table), qn(pk.column),
+                self.get_document_sql(model_admin, connection, 'NEW')),
+            'DROP TRIGGER IF EXISTS %s ON %s' % (qn(table + '_sync'), qn(model._meta.db_table)),
+            'CREATE TRIGGER %s AFTER INSERT OR UPDATE ON %s FOR EACH ROW EXECUTE PROCEDURE %s()' % (
+                qn(table + '_sync'), qn(model._meta.db_table), qn(table + '_sync')),
+        ]
+        self.execute(connection, statements)
+        self.refresh(model_admin, using)
+
+    def refresh(self, model_admin, using):
+        connection = connections[using]
+        qn = connection.ops.quote_name
+        model = model_admin.model
+        table = self.get_table_name(model, connection)
+        self.execute(connection, [
+            'INSERT INTO %s ("id", "document") SELECT %s, %s FROM %s '
+            'ON CONFLICT ("id") DO UPDATE SET "document" = EXCLUDED."document"' % (
+                qn(table), qn(model._meta.pk.column), self.get_document_sql(model_admin, connection),
+                qn(model._meta.db_table)),
+            'ANALYZE %s' % qn(table),
+        ])
+
+
+def get_indexed_views(urlconf=None):
+    """
+    Return the (search backend, model admin) pairs of the autocomplete views
+    of the URLconf whose backend is not the default one.
+    """
+    pairs = []
+
+    def walk(patterns):
+        for pattern in patterns:
+            if isinstance(pattern, URLResolver):
+                walk(pattern.url_patterns)
+                continue
+            view = _unwrap_view(pattern.callback)
+            view_class = getattr(view, 'view_class', None)
+            if view_class is None or not issubclass(view_class, AutocompleteJsonView):
+                continue
+            initkwargs = getattr(view, 'view_initkwargs', {})
+            backend = initkwargs.get('search_backend', view_class.search_backend)
+            model_admin = initkwargs.get('model_admin', view_class.model_admin)
+            if backend is None or type(backend) is SearchBackend or model_admin is None:
+                continue
+            if not any(b is backend and m.model is model_admin.model for b, m in pairs):
+                pairs.append((backend, model_admin))
+
+    walk(get_resolver(urlconf).url_patterns)
+    return pairs
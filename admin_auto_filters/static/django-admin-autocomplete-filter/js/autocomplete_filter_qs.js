@@ -1,17 +1,228 @@
 django.jQuery(document).ready(function () {
-  django.jQuery('#changelist-filter select, #grp-filters select').on(
+  init_filter_widgets();
+  // delegated, so the handler survives partial refreshes of the sidebar
+  django.jQuery(document).on(
       'change',
+      '#changelist-filter select, #grp-filters select',
       function (e, choice) {
           var val = django.jQuery(e.target).val() || '';
+          if (Array.isArray(val)) {
+              // multiple selections are passed comma-joined in one parameter
+              val = val.join(',');
+          }
           var class_name = this.className;
           var param = this.name;
           if (class_name.includes('admin-autocomplete'))
           {
-              window.location.search = search_replace(param, val);
+              if (django.jQuery(e.target).attr('data-partial-refresh') === 'true') {
+                  refresh_changelist(search_replace(param, val), true);
+              } else {
+                  window.location.search = search_replace(param, val);
+              }
           }
       });
+  window.addEventListener('popstate', function (e) {
+      if (e.state && e.state.autocomplete_filter) {
+          refresh_changelist(window.location.search, false);
+      }
+  });
 });
 
+function init_filter_widgets() {
+    django.jQuery('#changelist-filter select.admin-autocomplete, #grp-filters select.admin-autocomplete').each(
+        function () {
+            init_filter_select2(django.jQuery(this));
+        });
+}
+
+// Fetch the changelist for the given query string and swap #changelist in
+// place (results, pagination and filters), falling back to a full reload.
+// The server answers with a fragment when the model admin uses
+// PartialRefreshMixin.
+function refresh_changelist(search, push) {
+    django.jQuery.ajax({
+        url: window.location.pathname + search,
+        headers: {'X-Changelist-Fragment': '1'},
+        dataType: 'html'
+    }).done(function (html) {
+        var $changelist = django.jQuery('<div>').append(django.jQuery.parseHTML(html)).find('#changelist');
+        if (!$changelist.length) {
+            window.location.search = search;
+            return;
+        }
+        if (push) {
+            if (!(history.state && history.state.autocomplete_filter)) {
+                // mark the entry we leave, so going back to it refreshes too
+                history.replaceState({autocomplete_filter: true}, '');
+            }
+            history.pushState({autocomplete_filter: true}, '', search);
+        }
+        django.jQuery('#changelist').replaceWith($changelist);
+        init_filter_widgets();
+        var $actions = django.jQuery('tr input.action-select');
+        if ($actions.length && django.jQuery.fn.actions) {
+            $actions.actions();
+        }
+    }).fail(function () {
+        window.location.search = search;
+    });
+}
+
+// Re-initialise select2 on a filter widget so that the opaque cursor returned
+// by views using cursor pagination is sent back when scrolling, and facet
+// counts are shown next to the results.
+// Typing is debounced by select2 (data-ajax--delay), which also aborts the
+// request it supersedes; responses are kept in a per-filter LRU cache of
+// data-cache-size entries for the lifetime of the page. Options embedded in
+// data-prefetched are shown for the empty term without any request. With
+// data-batch-url, searches are sent through the batch endpoint. Responses
+// flagged keep_typing get a disabled hint after their results.
+// select2 is initialised directly: the admin's djangoAdminSelect2() takes no
+// options on recent Django versions, so the fields it sends to the admin's
+// autocomplete view (Django 3.2+) are added here.
+function init_filter_select2($element) {
+    var next_cursor = null;
+    var dataset = $element[0].dataset;
+    var batch_url = $element.attr('data-batch-url');
+    var cache = new ResponseCache(parseInt($element.attr('data-cache-size'), 10) || 0);
+    var prefetched = JSON.parse($element.attr('data-prefetched') || 'null');
+    if ($element.data('select2')) {
+      $element.select2('destroy');
+    }
+    $element.select2({
+      ajax: {
+        data: function (params) {
+          var query = {term: params.term, page: params.page};
+          if (dataset.appLabel) {
+            query.app_label = dataset.appLabel;
+            query.model_name = dataset.modelName;
+            query.field_name = dataset.fieldName;
+          }
+          if (params.page > 1 && next_cursor) {
+            query.cursor = next_cursor;
+          }
+          return query;
+        },
+        processResults: function (data, params) {
+          next_cursor = (data.pagination && data.pagination.next) || null;
+          if (data.keep_typing) {
+            // the search was cut short by the view's query budget
+            return {
+              results: data.results.concat([{id: '', text: 'Keep typing\u2026', disabled: true}]),
+              pagination: data.pagination
+            };
+          }
+          return data;
+        },
+        transport: function (params, success, failure) {
+          if (prefetched && !params.data.term && !(params.data.page > 1)) {
+            success({results: prefetched, pagination: {more: false}});
+            return {};
+          }
+          var key = params.url + '?' + django.jQuery.param(params.data);
+          var cached = cache.get(key);
+          if (cached !== undefined) {
+            success(cached);
+            return {};
+          }
+          var on_success = function (data) {
+            cache.set(key, data);
+            success(data);
+          };
+          if (batch_url) {
+            return batch_request(batch_url, params, on_success, failure);
+          }
+          var $request = django.jQuery.ajax(params);
+          $request.then(on_success);
+          $request.fail(failure);
+          return $request;
+        }
+      },
+      templateResult: function (item) {
+        // views with facet counts return the number of matching rows
+        if (item.count === undefined) {
+          return item.text;
+        }
+        return item.text + ' (' + item.count + ')';
+      }
+    });
+}
+
+// Queries issued in the same tick, per batch endpoint; they are sent together
+// once the current tick is over.
+var batch_queues = {};
+
+function batch_request(batch_url, params, success, failure) {
+    var query = {url: params.url, data: params.data, success: success, failure: failure, aborted: false};
+    if (!batch_queues[batch_url]) {
+      batch_queues[batch_url] = [];
+      setTimeout(function () { flush_batch(batch_url); }, 0);
+    }
+    batch_queues[batch_url].push(query);
+    // select2 aborts superseded searches
+    return {abort: function () { query.aborted = true; }};
+}
+
+function flush_batch(batch_url) {
+    var queries = batch_queues[batch_url].filter(function (query) { return !query.aborted; });
+    delete batch_queues[batch_url];
+    if (!queries.length) {
+      return;
+    }
+    django.jQuery.ajax({
+      url: batch_url,
+      data: {queries: JSON.stringify(queries.map(function (query, i) {
+        return {id: i, url: query.url, data: query.data};
+      }))},
+      dataType: 'json'
+    }).done(function (data) {
+      data.responses.forEach(function (response) {
+        var query = queries[response.id];
+        if (query.aborted) {
+          return;
+        }
+        if (response.status === 200) {
+          query.success(response.data);
+        } else {
+          query.failure();
+        }
+      });
+    }).fail(function () {
+      queries.forEach(function (query) {
+        if (!query.aborted) {
+          query.failure();
+        }
+      });
+    });
+}
+
+// A small least-recently-used cache; Map keeps keys in insertion order.
+function ResponseCache(size) {
+    this.size = size;
+    this.entries = new Map();
+}
+
+ResponseCache.prototype.get = function (key) {
+    if (!this.entries.has(key)) {
+      return undefined;
+    }
+    var value = this.entries.get(key);
+    this.entries.delete(key);
+    this.entries.set(key, value);
+    return value;
+};
+
+ResponseCache.prototype.set = function (key, value) {
+    if (this.size <= 0) {
+      return;
+    }
+    this.entries.delete(key);
+    this.entries.set(key, value);
+    if (this.entries.size > this.size) {
+      this.entries.delete(this.entries.keys().next().value);
+    }
+};
+
 function search_replace(name, value) {
     var new_search_hash = search_to_hash();
     if (value) {
@@ -1,10 +1,109 @@
-from django.http import JsonResponse
+import asyncio
+import base64
+import binascii
+import copy
+import inspect
+import json
+import time
+from contextlib import contextmanager
+from functools import lru_cache
+from urllib.parse import urlsplit
+from asgiref.sync import async_to_sync, sync_to_async
+from django import VERSION as DJANGO_VERSION
+from django.apps import apps
+from django.contrib.admin import AdminSite, ModelAdmin
+from django.contrib.admin.exceptions import DisallowedModelAdminLookup
+from django.contrib.admin.options import IncorrectLookupParameters
+from django.contrib.admin.utils import NotRelationField, get_fields_from_path
+from django.core.exceptions import FieldDoesNotExist, ImproperlyConfigured, PermissionDenied
+from django.core.paginator import InvalidPage
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import OperationalError, connections, router, transaction
+from django.db.models import Case, CharField, Count, IntegerField, Q, TextField, Value, When
+from django.db.models.constants import LOOKUP_SEP
+from django.http import Http404, JsonResponse, QueryDict
+from django.urls import Resolver404, get_script_prefix, resolve
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.decorators import classonlymethod
+from django.utils.http import quote_etag
+from django.views.generic import View
 from django.contrib.admin.views.autocomplete import AutocompleteJsonView as Base
+from .cache import (
+    KEY_PREFIX, check_shared_cache, get_cache, get_model_version, get_user_scope, is_cached_model, make_digest,
+    make_key,
+)
+from .db import get_database, route
+from .instrumentation import timing
 
 
 class AutocompleteJsonView(Base):
     """Overriding django admin's AutocompleteJsonView"""
 
+    # passed to as_view(); Django 3.2+ finds it from the request instead
+    model_admin = None
+
+    # Opt-in keyset pagination: results are fetched with a WHERE clause on the
+    # ordering columns instead of COUNT(*) + OFFSET. The ordering must only use
+    # non-null, concrete columns; the pk is appended as a tie-breaker.
+    cursor_pagination = False
+
+    # Field names or expressions to build the label from. When set, the
+    # endpoint runs a values_list() query and never instantiates the model;
+    # the values are passed to display_text_from_values().
+    label_fields = ()
+
+    # Seconds to keep responses in the shared cache; None disables caching.
+    # Entries are invalidated when any model from get_cache_models() changes.
+    cache_timeout = None
+
+    # Opt-in conditional GET: responses carry an ETag built like the cache key
+    # (from the model version stamps), and requests with a matching
+    # If-None-Match get a 304 without running the search. Register the view
+    # with admin_view(..., cacheable=True), as never_cache() forbids storing it.
+    use_etags = False
+
+    # Opt-in facet counts: the number of facet_model rows matching each result
+    # through facet_lookup (e.g. facet_model = Album, facet_lookup = 'artist'),
+    # computed with one GROUP BY query. If more than facet_limit rows match the
+    # page of results, counts are left out instead of scanning them all.
+    facet_model = None
+    facet_lookup = None
+    facet_limit = 10000
+
+    # Filters with scope_to_changelist pass the changelist they are rendered in
+    # (scope_model, scope_lookup and scope query string); results are then
+    # restricted to values referenced by that filtered changelist. With
+    # scope_cache_timeout, up to scope_cache_limit referenced values are cached.
+    scope_cache_timeout = None
+    scope_cache_limit = 10000
+
+    # database alias for the search, facet and scope queries, e.g. a read
+    # replica; ADMIN_AUTO_FILTERS_DATABASE if unset
+    using = None
+
+    # Query budget. Shorter non-empty terms than min_term_length get no results
+    # and a keep_typing flag, without querying. With statement_timeout (in ms;
+    # PostgreSQL, MySQL and SQLite), a search running longer is cancelled and
+    # retried as a prefix search (^ on the search fields), then answered with
+    # no results and keep_typing. With scan_limit, when the model admin queryset
+    # has more rows than that, terms are only searched by prefix, with keep_typing;
+    # whether it has is cached for scan_limit_cache_timeout seconds.
+    min_term_length = 0
+    statement_timeout = None
+    scan_limit = None
+    scan_limit_cache_timeout = 300
+
+    # a SearchBackend from admin_auto_filters.search searching an index instead
+    # of the model admin's get_search_results(); None for the latter
+    search_backend = None
+
+    # Two-phase search: look the term up by prefix (^ on the search fields),
+    # which can use an index, with rows having a text search field equal to the
+    # term first; only run the full search, for the rows not found that way,
+    # when the prefix matches do not fill the page. Not used with cursor
+    # pagination or a search_backend.
+    prefix_first = False
+
     @staticmethod
     def display_text(obj):
         """
@@ -12,15 +111,903 @@ class AutocompleteJsonView(Base):
         """
         return str(obj)
 
+    @staticmethod
+    def display_text_from_values(values):
+        """
+        Hook to build the endpoint text from the values of label_fields.
+        """
+        return ' '.join(str(value) for value in values if value is not None)
+
+    def get_queryset(self):
+        source_field = getattr(self, 'source_field', None)
+        if source_field is not None and self.search_backend is None:
+            return super().get_queryset()
+        # views given a model_admin do not know the field they search for
+        qs = self.model_admin.get_queryset(self.request)
+        if source_field is not None:
+            qs = qs.complex_filter(source_field.get_limit_choices_to())
+        qs, search_use_distinct = self.get_search_results(qs)
+        if search_use_distinct:
+            qs = qs.distinct()
+        return qs
+
+    def get_search_results(self, queryset):
+        """Search queryset for the term, with search_backend if it supports the database."""
+        queryset = route(queryset, self.using)
+        backend = self.search_backend
+        if backend is None or not backend.supports(connections[queryset.db]):
+            return self.model_admin.get_search_results(self.request, queryset, self.term)
+        return backend.get_search_results(self.request, self.model_admin, queryset, self.term)
+
     def get(self, request, *args, **kwargs):
         self.term = request.GET.get('term', '')
         self.paginator_class = self.model_admin.paginator
-        self.object_list = self.get_queryset()
-        context = self.get_context_data()
+        etag = None
+        try:
+            if self.use_etags:
+                check_shared_cache()
+                etag = quote_etag(self.get_request_digest(request))
+                response = get_conditional_response(request, etag=etag)
+                if response is not None:
+                    return self.patch_etag(response, etag)
+            if self.is_term_too_short():
+                data = self.get_keep_typing_data()
+            elif self.cache_timeout is None:
+                data = self.get_data_within_budget(request)
+            else:
+                cache = get_cache()
+                key = self.get_cache_key(request)
+                data = cache.get(key)
+                if data is None:
+                    data = self.get_data_within_budget(request)
+                    cache.set(key, data, self.cache_timeout)
+        except ValueError:
+            return JsonResponse({'error': '400 Bad Request'}, status=400)
+        response = JsonResponse(data)
+        if etag is not None:
+            self.patch_etag(response, etag)
+        return response
+
+    def is_term_too_short(self):
+        term = self.term.strip()
+        return bool(term) and len(term) < self.min_term_length
+
+    def get_page_number(self, request):
+        """Return the requested page number, raising Http404 if it is not one."""
+        try:
+            page = int(request.GET.get(self.page_kwarg) or 1)
+        except ValueError:
+            page = 0
+        if page < 1:
+            raise Http404('Invalid page.')
+        return page
+
+    def get_keep_typing_data(self):
+        """The response for searches not run, or given up."""
+        return {'results': [], 'pagination': {'more': False}, 'keep_typing': True}
+
+    def get_data_within_budget(self, request):
+        """
+        Run get_data() under statement_timeout; if it is cancelled, or the
+        search would scan more than scan_limit rows, run it as a prefix search
+        instead, and give up if that is cancelled too.
+        """
+        if self.scan_limit is not None and self.term.strip() and self.exceeds_scan_limit(request):
+            return self.get_prefix_data(request)
+        if self.statement_timeout is None:
+            return self.get_data(request)
+        try:
+            with _statement_timeout(self.get_search_database(), self.statement_timeout):
+                return self.get_data(request)
+        except OperationalError:
+            pass
+        return self.get_prefix_data(request)
+
+    def get_prefix_data(self, request):
+        """Run get_data() as a prefix search (^ on the search fields), flagged keep_typing."""
+        model_admin = self.model_admin
+        self.model_admin = _get_prefix_search_admin(model_admin, request)
+        try:
+            if self.statement_timeout is None:
+                data = self.get_data(request)
+            else:
+                with _statement_timeout(self.get_search_database(), self.statement_timeout):
+                    data = self.get_data(request)
+        except OperationalError:
+            return self.get_keep_typing_data()
+        finally:
+            self.model_admin = model_admin
+        data['keep_typing'] = True
+        return data
+
+    def get_search_database(self):
+        return get_database(self.using) or router.db_for_read(self.model_admin.model)
+
+    def exceeds_scan_limit(self, request):
+        """
+        Whether the model admin queryset has more than scan_limit rows, from
+        the cache if possible. Checking counts as exceeding if it times out.
+        """
+        model = self.model_admin.model
+        parts = [
+            '%s.%s' % (type(self.model_admin).__module__, type(self.model_admin).__qualname__),
+            # the stamp, if the model is tracked; else only the timeout limits staleness
+            get_model_version(model) if is_cached_model(model) else None,
+            self.get_search_database(),
+            self.scan_limit,
+            self.get_cache_scope(request),
+        ]
+        key = make_key('scan_limit', parts)
+        cache = get_cache()
+        exceeds = cache.get(key)
+        if exceeds is None:
+            rows = route(self.model_admin.get_queryset(request), self.using).order_by().values('pk')
+            try:
+                if self.statement_timeout is None:
+                    exceeds = rows[self.scan_limit:self.scan_limit + 1].exists()
+                else:
+                    with _statement_timeout(self.get_search_database(), self.statement_timeout):
+                        exceeds = rows[self.scan_limit:self.scan_limit + 1].exists()
+            except OperationalError:
+                exceeds = True
+            cache.set(key, exceeds, self.scan_limit_cache_timeout)
+        return exceeds
+
+    def patch_etag(self, response, etag):
+        """Set the ETag, and let browsers store the response but revalidate it."""
+        response['ETag'] = etag
+        patch_cache_control(response, private=True, no_cache=True)
+        return response
+
+    def get_data(self, request):
+        """
+        Run the search and return the response payload as a dict. The search
+        phase fetches the rows of the page; the paginate phase only counts the
+        matches, for the paginator to tell whether there are more.
+        """
+        pagination = None
+        with timing(request, type(self), 'autocomplete.search'):
+            self.object_list = route(self.get_queryset(), self.using)
+            prefix_list = None
+            if self.use_prefix_first():
+                prefix_list = self.get_prefix_queryset(request)
+            scope = self.get_scope(request)
+            if scope is not None:
+                scope_values = self.get_scope_values(request, *scope)
+                self.object_list = self.object_list.filter(pk__in=scope_values)
+                if prefix_list is not None:
+                    prefix_list = prefix_list.filter(pk__in=scope_values)
+            if self.cursor_pagination:
+                object_list, pagination = self.paginate_by_cursor(
+                    self.object_list, request.GET.get('cursor'))
+            elif prefix_list is not None:
+                object_list, pagination = self.paginate_prefix_first(request, prefix_list, self.object_list)
+            else:
+                if self.label_fields:
+                    self.object_list = self.object_list.values_list('pk', *self.label_fields)
+                page = self.get_page_number(request)
+                start = (page - 1) * self.paginate_by
+                object_list = list(self.object_list[start:start + self.paginate_by])
+        if pagination is None:
+            with timing(request, type(self), 'autocomplete.paginate'):
+                # no orphans, as the rows were sliced by paginate_by
+                paginator = self.get_paginator(
+                    self.object_list, self.paginate_by, orphans=0, allow_empty_first_page=self.get_allow_empty())
+                try:
+                    page_obj = paginator.page(page)
+                except InvalidPage:
+                    raise Http404('Invalid page.')
+                pagination = {'more': page_obj.has_next()}
+        with timing(request, type(self), 'autocomplete.serialize'):
+            results = [self.serialize_result(obj) for obj in object_list]
+        if self.facet_model is not None and results:
+            with timing(request, type(self), 'autocomplete.facets'):
+                self.add_facet_counts(results)
+        return {
+            'results': results,
+            'pagination': pagination,
+        }
+
+    def use_prefix_first(self):
+        return (
+            self.prefix_first and bool(self.term.strip())
+            and not self.cursor_pagination and self.search_backend is None
+        )
+
+    def get_prefix_queryset(self, request):
+        """Return the rows matching the term by prefix, those equal to it first."""
+        model_admin = self.model_admin
+        self.model_admin = _get_prefix_search_admin(model_admin, request)
+        try:
+            queryset = route(self.get_queryset(), self.using)
+        finally:
+            self.model_admin = model_admin
+        exact = Q()
+        for name in model_admin.get_search_fields(request):
+            try:
+                field = model_admin.model._meta.get_field(name.lstrip('^=@'))
+            except FieldDoesNotExist:
+                # a path through a relation, which could duplicate rows
+                continue
+            if isinstance(field, (CharField, TextField)):
+                exact |= Q(**{'%s__iexact' % field.name: self.term.strip()})
+        if not exact:
+            return queryset
+        ordering = queryset.query.order_by or queryset.model._meta.ordering or ['pk']
+        return queryset.annotate(
+            exact_match=Case(When(exact, then=Value(0)), default=Value(1), output_field=IntegerField()),
+        ).order_by('exact_match', *ordering)
+
+    def paginate_prefix_first(self, request, prefix_list, object_list):
+        """
+        Return a page of the prefix matches, followed by the other matches of
+        object_list once they run out, and the pagination dict.
+        """
+        page = self.get_page_number(request)
+        others = object_list.exclude(pk__in=prefix_list.order_by().values('pk'))
+        if self.label_fields:
+            prefix_list = prefix_list.values_list('pk', *self.label_fields)
+            others = others.values_list('pk', *self.label_fields)
+        start = (page - 1) * self.paginate_by
+        stop = start + self.paginate_by + 1
+        rows = list(prefix_list[start:stop])
+        if len(rows) < stop - start:
+            # the prefix matches ran out on this page
+            prefix_count = start + len(rows) if rows or not start else prefix_list.count()
+            offset = max(start - prefix_count, 0)
+            rows += others[offset:offset + stop - start - len(rows)]
+            if not rows and page > 1:
+                raise Http404('Invalid page.')
+        return rows[:self.paginate_by], {'more': len(rows) > self.paginate_by}
+
+    def add_facet_counts(self, results):
+        """
+        Set 'count' on each result to the number of facet_model rows matching it,
+        unless more than facet_limit rows match the whole page.
+        """
+        lookup = '%s__in' % self.facet_lookup
+        rows = self.get_facet_queryset(self.request)
+        rows = rows.filter(**{lookup: [result['id'] for result in results]})
+        if self.facet_limit is not None:
+            limited = rows.order_by().values('pk')[:self.facet_limit + 1]
+            if not connections[rows.db].features.allow_sliced_subqueries_with_in:
+                limited = list(limited.values_list('pk', flat=True))
+            rows = rows.filter(pk__in=limited)
+        counts = dict(
+            rows.order_by().values_list(self.facet_lookup).annotate(count=Count('pk', distinct=True))
+        )
+        if self.facet_limit is not None and sum(counts.values()) > self.facet_limit:
+            return
+        counts = {str(key): count for key, count in counts.items()}
+        for result in results:
+            result['count'] = counts.get(result['id'], 0)
+
+    def get_facet_queryset(self, request):
+        """
+        Return the facet_model rows to count: those of the filtered changelist
+        if the request is scoped to a changelist of facet_model, else all.
+        """
+        scope = self.get_scope(request)
+        if scope is not None and scope[0].model._meta.concrete_model is self.facet_model._meta.concrete_model:
+            return self.get_scope_queryset(request, scope[0], scope[2])
+        return route(self.facet_model._default_manager.all(), self.using)
+
+    def get_scope(self, request):
+        """
+        Return (model_admin, lookup, query string) of the changelist the results
+        are scoped to, or None if the request is not scoped.
+        """
+        label = request.GET.get('scope_model')
+        if not label:
+            return None
+        try:
+            model_admin = self.model_admin.admin_site._registry[apps.get_model(label)]
+        except (LookupError, ValueError, KeyError) as e:
+            raise ValueError('Invalid scope model.') from e
+        if not model_admin.has_view_permission(request):
+            raise PermissionDenied
+        lookup = request.GET.get('scope_lookup', '')
+        try:
+            fields = get_fields_from_path(model_admin.model, lookup)
+        except (FieldDoesNotExist, NotRelationField) as e:
+            raise ValueError('Invalid scope lookup.') from e
+        if not fields[-1].is_relation:
+            raise ValueError('Invalid scope lookup.')
+        if not model_admin.lookup_allowed(lookup, None):
+            raise DisallowedModelAdminLookup('Filtering by %s not allowed' % lookup)
+        return model_admin, lookup, request.GET.get('scope', '')
+
+    def get_scope_queryset(self, request, model_admin, query_string):
+        """Return the queryset of the changelist of model_admin filtered by query_string."""
+        scope_request = copy.copy(request)
+        scope_request.GET = QueryDict(query_string)
+        try:
+            changelist = _get_filtered_changelist(model_admin, scope_request)
+        except IncorrectLookupParameters as e:
+            raise ValueError('Invalid scope.') from e
+        return route(changelist.queryset, self.using)
+
+    def get_scope_values(self, request, model_admin, lookup, query_string):
+        """
+        Return the values of lookup in the filtered changelist, as a subquery,
+        or as a cached list if scope_cache_timeout is set and they are few.
+        """
+        values = self.get_scope_queryset(request, model_admin, query_string).order_by().values(lookup)
+        if self.scope_cache_timeout is None:
+            return values
+        cache = get_cache()
+        parts = [
+            model_admin.model._meta.label_lower,
+            get_model_version(model_admin.model),
+            lookup,
+            query_string,
+            self.get_cache_scope(request),
+        ]
+        key = make_key('scope', parts)
+        cached = cache.get(key)
+        if cached is None:
+            cached = list(values.values_list(lookup, flat=True).distinct()[:self.scope_cache_limit + 1])
+            if len(cached) > self.scope_cache_limit:
+                return values
+            cache.set(key, cached, self.scope_cache_timeout)
+        return [value for value in cached if value is not None]
+
+    def get_cache_models(self):
+        """
+        Return the models whose changes invalidate cached responses.
+        Override if get_queryset() returns another model than the model admin's.
+        """
+        models = [self.model_admin.model]
+        if self.facet_model is not None:
+            models.append(self.facet_model)
+        scope = self.get_scope(self.request)
+        if scope is not None:
+            models.append(scope[0].model)
+        return models
+
+    def get_cache_scope(self, request):
+        """
+        Return a string identifying what the user is allowed to see, so users
+        with the same permissions share cache entries.
+        """
+        return get_user_scope(request.user)
+
+    def get_cache_key(self, request):
+        """Build the cache key for the current request."""
+        return '%s:results:%s' % (KEY_PREFIX, self.get_request_digest(request))
+
+    def get_request_digest(self, request):
+        """
+        Hash what the response depends on: the view and its URL (views of the
+        same class may be registered with other options), the model versions,
+        the search parameters and the permissions of the user.
+        """
+        versions = [get_model_version(model) for model in self.get_cache_models()]
+        if self.use_etags and None in versions:
+            raise ImproperlyConfigured('The cache did not keep the version stamps %s needs for ETags.'
+                                       % type(self).__name__)
+        parts = [
+            '%s.%s' % (type(self).__module__, type(self).__qualname__),
+            request.path,
+            '%s.%s' % (type(self.model_admin).__module__, type(self.model_admin).__qualname__),
+            versions,
+            self.term,
+            request.GET.get('page', ''),
+            request.GET.get('cursor', ''),
+            request.GET.get('scope_model', ''),
+            request.GET.get('scope_lookup', ''),
+            request.GET.get('scope', ''),
+            self.get_cache_scope(request),
+        ]
+        return make_digest(parts)
+
+    def serialize_result(self, obj):
+        """
+        Convert a row to a result dict; obj is a tuple of ('pk', *label_fields)
+        values when label_fields is set, else a model instance.
+        """
+        if self.label_fields:
+            return {
+                'id': str(obj[0]),
+                'text': self.display_text_from_values(obj[1:len(self.label_fields) + 1]),
+            }
+        return {'id': str(obj.pk), 'text': self.display_text(obj)}
+
+    def get_cursor_ordering(self, queryset):
+        """
+        Return the ordering used for keyset pagination, as a list of
+        (field_name, descending) tuples ending with the primary key.
+        """
+        ordering = queryset.query.order_by or queryset.model._meta.ordering or ()
+        fields = []
+        for item in ordering:
+            if not isinstance(item, str) or item == '?':
+                raise ImproperlyConfigured('Cursor pagination requires ordering by field names.')
+            fields.append((item.lstrip('-'), item.startswith('-')))
+        pk_names = ('pk', queryset.model._meta.pk.name)
+        if not any(name in pk_names for name, _ in fields):
+            fields.append(('pk', False))
+        return fields
+
+    def paginate_by_cursor(self, queryset, cursor):
+        """
+        Return one page of objects after the given cursor, plus the pagination
+        dict. Fetches paginate_by + 1 rows to know if there are more, so no
+        COUNT(*) is issued.
+        """
+        queryset, ordering = self.get_cursor_queryset(queryset, cursor)
+        return self.get_cursor_page(list(queryset[:self.paginate_by + 1]), ordering)
+
+    def get_cursor_queryset(self, queryset, cursor):
+        """Return the queryset of rows after the cursor, and its ordering."""
+        ordering = self.get_cursor_ordering(queryset)
+        queryset = queryset.order_by(*[('-' if desc else '') + name for name, desc in ordering])
+        if cursor:
+            values = _decode_cursor(cursor)
+            if len(values) != len(ordering):
+                raise ValueError('Cursor does not match the ordering.')
+            queryset = queryset.filter(_keyset_filter(ordering, values))
+        if self.label_fields:
+            # the ordering values are appended so the cursor can be built from tuples
+            queryset = queryset.values_list('pk', *self.label_fields, *[name for name, _ in ordering])
+        return queryset, ordering
+
+    def get_cursor_page(self, object_list, ordering):
+        """Build the page and pagination dict from up to paginate_by + 1 rows."""
+        more = len(object_list) > self.paginate_by
+        object_list = object_list[:self.paginate_by]
+        pagination = {'more': more}
+        if more:
+            last = object_list[-1]
+            if self.label_fields:
+                values = list(last[-len(ordering):])
+            else:
+                values = [_lookup_value(last, name) for name, _ in ordering]
+            pagination['next'] = _encode_cursor(values)
+        return object_list, pagination
+
+
+class AsyncAutocompleteJsonView(AutocompleteJsonView):
+    """
+    AutocompleteJsonView running on the event loop under ASGI, with the same
+    hooks and options except statement_timeout, scan_limit and prefix_first,
+    which as_view() refuses.
+    Rows are fetched with async iteration of the queryset, and pages by
+    fetching paginate_by + 1 rows instead of counting them; cache, scope and
+    facet queries still go through sync_to_async().
+    Requires Django 4.1.
+
+    admin_view() cannot wrap async views, so this view checks
+    admin_site.has_permission() itself: register it as a plain view.
+    display_text() must not query, so select_related() what it needs in
+    get_queryset() or use label_fields.
+    """
+
+    @classonlymethod
+    def as_view(cls, **initkwargs):
+        for name in ('statement_timeout', 'scan_limit', 'prefix_first'):
+            if initkwargs.get(name, getattr(cls, name)) != getattr(AutocompleteJsonView, name):
+                raise ImproperlyConfigured('%s does not support %s.' % (cls.__name__, name))
+        if DJANGO_VERSION < (4, 1):
+            raise ImproperlyConfigured('%s requires Django 4.1 or later.' % cls.__name__)
+        return super().as_view(**initkwargs)
+
+    async def get(self, request, *args, **kwargs):
+        if not await sync_to_async(self.model_admin.admin_site.has_permission)(request):
+            return JsonResponse({'error': '403 Forbidden'}, status=403)
+        self.term = request.GET.get('term', '')
+        self.paginator_class = self.model_admin.paginator
+        if self.is_term_too_short():
+            return JsonResponse(self.get_keep_typing_data())
+        etag = None
+        try:
+            if self.use_etags:
+                etag = quote_etag(await sync_to_async(self.get_request_digest)(request))
+                response = get_conditional_response(request, etag=etag)
+                if response is not None:
+                    return self.patch_etag(response, etag)
+            if self.cache_timeout is None:
+                data = await self.aget_data(request)
+            else:
+                cache = get_cache()
+                key = await sync_to_async(self.get_cache_key)(request)
+                data = await cache.aget(key)
+                if data is None:
+                    data = await self.aget_data(request)
+                    await cache.aset(key, data, self.cache_timeout)
+        except ValueError:
+            return JsonResponse({'error': '400 Bad Request'}, status=400)
+        response = JsonResponse(data)
+        if etag is not None:
+            self.patch_etag(response, etag)
+        return response
+
+    async def aget_data(self, request):
+        """Async version of get_data()."""
+        self.object_list = route(self.get_queryset(), self.using)
+        scope = await sync_to_async(self.get_scope)(request)
+        if scope is not None:
+            values = await sync_to_async(self.get_scope_values)(request, *scope)
+            self.object_list = self.object_list.filter(pk__in=values)
+        if self.cursor_pagination:
+            queryset, ordering = self.get_cursor_queryset(self.object_list, request.GET.get('cursor'))
+            rows = [row async for row in queryset[:self.paginate_by + 1]]
+            object_list, pagination = self.get_cursor_page(rows, ordering)
+        else:
+            queryset = self.object_list
+            if self.label_fields:
+                queryset = queryset.values_list('pk', *self.label_fields)
+            page = self.get_page_number(request)
+            start = (page - 1) * self.paginate_by
+            rows = [row async for row in queryset[start:start + self.paginate_by + 1]]
+            if not rows and page > 1:
+                raise Http404('Invalid page.')
+            object_list = rows[:self.paginate_by]
+            pagination = {'more': len(rows) > self.paginate_by}
+        results = [self.serialize_result(obj) for obj in object_list]
+        if self.facet_model is not None and results:
+            await sync_to_async(self.add_facet_counts)(results)
+        return {
+            'results': results,
+            'pagination': pagination,
+        }
+
+
+class AutocompleteValuesView(AutocompleteJsonView):
+    """
+    Search the distinct values of a plain column, for the AutocompleteValueFilter
+    of the model admin named by the field parameter (its parameter_name).
+    Values are matched with the filter's search_lookup and paginated by keyset
+    on the value, so each page is an index range scan without OFFSET or COUNT.
+    With the filter's snapshot_timeout, the distinct values are fetched once,
+    cached, and searched in memory. Served by ValuesAutocompleteMixin.
+    """
+
+    def get_filter(self, request):
+        """Return the AutocompleteValueFilter class named by the field parameter."""
+        from .filters import AutocompleteValueFilter  # filters imports this module
+        if not self.model_admin.has_view_permission(request):
+            raise PermissionDenied
+        name = request.GET.get('field', '')
+        for list_filter in self.model_admin.get_list_filter(request):
+            if (isinstance(list_filter, type) and issubclass(list_filter, AutocompleteValueFilter)
+                    and list_filter.parameter_name == name):
+                return list_filter
+        raise ValueError('Invalid field.')
+
+    def get_column(self, spec):
+        """Return the model field of the column of the filter spec."""
+        try:
+            field = get_fields_from_path(self.model_admin.model, spec.field_name)[-1]
+        except (FieldDoesNotExist, NotRelationField) as e:
+            raise ImproperlyConfigured('Invalid field_name for %s.' % spec.__name__) from e
+        if field.is_relation:
+            raise ImproperlyConfigured('%s filters on a relation, use AutocompleteFilter.' % spec.__name__)
+        return field
+
+    def get_cache_models(self):
+        models = [self.model_admin.model]
+        for field in get_fields_from_path(self.model_admin.model, self.get_filter(self.request).field_name):
+            if field.model not in models:
+                models.append(field.model)
+        return models
+
+    def get_request_digest(self, request):
+        return make_digest([super().get_request_digest(request), request.GET.get('field', '')])
+
+    def get_values_queryset(self, request, spec):
+        """
+        Return the distinct non-empty values of the column, ordered, in the
+        changelist filtered by the scope parameter if the filter is scoped.
+        """
+        column = self.get_column(spec)
+        query_string = request.GET.get('scope')
+        if spec.scope_to_changelist and query_string is not None:
+            queryset = self.get_scope_queryset(request, self.model_admin, query_string)
+        else:
+            queryset = self.model_admin.get_queryset(request)
+        path = spec.field_name
+        queryset = route(queryset, spec.using or self.using).exclude(**{'%s__isnull' % path: True})
+        if isinstance(column, (CharField, TextField)):
+            queryset = queryset.exclude(**{path: ''})
+        return queryset.order_by(path).values_list(path, flat=True).distinct()
+
+    def get_data(self, request):
+        spec = self.get_filter(request)
+        # pages are fetched by keyset or from the snapshot, without counting
+        with timing(request, type(self), 'autocomplete.search'):
+            values = self.get_values_queryset(request, spec)
+            snapshot = None
+            if spec.snapshot_timeout is not None and 'scope' not in request.GET:
+                snapshot = self.get_snapshot(request, spec, values)
+            if snapshot is None:
+                object_list, pagination = self.paginate_values(request, spec, values)
+            else:
+                object_list, pagination = self.paginate_snapshot(request, spec, snapshot)
+        return {
+            'results': [{'id': str(value), 'text': str(value)} for value in object_list],
+            'pagination': pagination,
+        }
+
+    def paginate_values(self, request, spec, values):
+        """Return the page of values after the cursor, and the pagination dict."""
+        term = self.term.strip()
+        if term:
+            values = values.filter(**{'%s__%s' % (spec.field_name, spec.search_lookup): term})
+        cursor = request.GET.get('cursor')
+        if cursor:
+            last = _decode_cursor(cursor)
+            if len(last) != 1:
+                raise ValueError('Invalid cursor.')
+            values = values.filter(**{'%s__gt' % spec.field_name: last[0]})
+        object_list = list(values[:self.paginate_by + 1])
+        pagination = {'more': len(object_list) > self.paginate_by}
+        object_list = object_list[:self.paginate_by]
+        if pagination['more']:
+            pagination['next'] = _encode_cursor(object_list[-1:])
+        return object_list, pagination
+
+    def get_snapshot(self, request, spec, values):
+        """
+        Return the distinct values as strings, from the cache if possible, or
+        None if there are more than the filter's snapshot_limit.
+        """
+        parts = [
+            '%s.%s' % (spec.__module__, spec.__qualname__),
+            self.model_admin.model._meta.label_lower,
+            [get_model_version(model) for model in self.get_cache_models()],
+            self.get_cache_scope(request),
+        ]
+        key = make_key('values', parts)
+        cache = get_cache()
+        snapshot = cache.get(key)
+        if snapshot is None:
+            snapshot = [str(value) for value in values[:spec.snapshot_limit + 1]]
+            if len(snapshot) > spec.snapshot_limit:
+                # remembered, so the values are not counted on every request
+                snapshot = False
+            cache.set(key, snapshot, spec.snapshot_timeout)
+        return None if snapshot is False else snapshot
+
+    def paginate_snapshot(self, request, spec, snapshot):
+        """Return a page of the snapshot values matching the term, and the pagination dict."""
+        page = self.get_page_number(request)
+        term = self.term.strip()
+        if term:
+            snapshot = [value for value in snapshot if _value_matches(value, term, spec.search_lookup)]
+        start = (page - 1) * self.paginate_by
+        return snapshot[start:start + self.paginate_by], {'more': len(snapshot) > start + self.paginate_by}
+
+
+class AutocompleteBatchView(View):
+    """
+    Answer several autocomplete queries in one request, so the session and
+    user are loaded once for all of them. Each view is still called with its
+    decorators, admin_view() included, so its own checks apply.
+
+    The queries GET parameter is a JSON list of {"id", "url", "data"} objects,
+    where url is the endpoint of a filter widget and data its GET parameters.
+    Only autocomplete views of the same admin site are answered; the response
+    lists {"id", "status", "data"} in the order of the queries.
+    """
+    admin_site = None
+    max_queries = 20
+
+    def get(self, request, *args, **kwargs):
+        try:
+            queries = self.get_queries(request)
+        except ValueError:
+            return JsonResponse({'error': '400 Bad Request'}, status=400)
         return JsonResponse({
-            'results': [
-                {'id': str(obj.pk), 'text': self.display_text(obj)}
-                for obj in context['object_list']
-            ],
-            'pagination': {'more': context['page_obj'].has_next()},
+            'responses': [self.answer(request, query) for query in queries],
         })
+
+    def get_queries(self, request):
+        """Parse and validate the queries parameter."""
+        try:
+            queries = json.loads(request.GET.get('queries', ''))
+        except json.JSONDecodeError as e:
+            raise ValueError('Invalid queries.') from e
+        if not isinstance(queries, list) or len(queries) > self.max_queries:
+            raise ValueError('Invalid queries.')
+        for query in queries:
+            if (not isinstance(query, dict) or not isinstance(query.get('url'), str)
+                    or not isinstance(query.get('data', {}), dict)):
+                raise ValueError('Invalid queries.')
+        return queries
+
+    def answer(self, request, query):
+        """Run one query through its autocomplete view."""
+        split = urlsplit(query['url'])
+        prefix = get_script_prefix()
+        path_info = '/' + split.path[len(prefix):]
+        view = self.get_view(path_info) if split.path.startswith(prefix) else None
+        if view is None:
+            return {'id': query.get('id'), 'status': 404, 'data': {'error': '404 Not Found'}}
+        view, match = view
+        sub_request = copy.copy(request)
+        sub_request.path = split.path
+        sub_request.path_info = path_info
+        sub_request.GET = QueryDict(split.query, mutable=True)
+        for key, value in query.get('data', {}).items():
+            if value is not None:
+                sub_request.GET[key] = str(value)
+        if asyncio.iscoroutinefunction(view):
+            view = async_to_sync(view)
+        try:
+            response = view(sub_request, *match.args, **match.kwargs)
+        except Http404:
+            return {'id': query.get('id'), 'status': 404, 'data': {'error': '404 Not Found'}}
+        except PermissionDenied:
+            return {'id': query.get('id'), 'status': 403, 'data': {'error': '403 Forbidden'}}
+        if not response.get('Content-Type', '').startswith('application/json'):
+            # e.g. the redirect of a failed login_required() check
+            return {'id': query.get('id'), 'status': response.status_code, 'data': {'error': response.status_code}}
+        return {'id': query.get('id'), 'status': response.status_code, 'data': json.loads(response.content)}
+
+    def get_view(self, path_info):
+        """
+        Return (view, resolver match) for an autocomplete view of this admin
+        site at path_info, or None. The view is only unwrapped to identify it:
+        it is called with its decorators, so their checks still apply.
+        """
+        try:
+            match = resolve(path_info)
+        except Resolver404:
+            return None
+        view = _unwrap_view(match.func)
+        owner = getattr(view, '__self__', None)
+        if isinstance(owner, AdminSite) and view.__name__ == 'autocomplete_view':
+            # Django 3.2+
+            admin_site = owner
+        elif isinstance(owner, ModelAdmin) and view.__name__ == 'autocomplete_view':
+            admin_site = owner.admin_site
+        elif issubclass(getattr(view, 'view_class', type(None)), Base):
+            model_admin = view.view_initkwargs.get('model_admin', view.view_class.model_admin)
+            admin_site = getattr(model_admin, 'admin_site', None)
+        else:
+            return None
+        if admin_site is not self.admin_site:
+            return None
+        return match.func, match
+
+
+@lru_cache(maxsize=None)
+def _filtered_changelist_class(changelist_class):
+    """A ChangeList subclass which does not count or fetch its results."""
+    class FilteredChangeList(changelist_class):
+        def get_results(self, request):
+            pass
+    return FilteredChangeList
+
+
+def _get_filtered_changelist(model_admin, request):
+    """
+    Build the changelist of model_admin for request, with its filtered queryset
+    but without running the changelist queries.
+    """
+    changelist_class = _filtered_changelist_class(model_admin.get_changelist(request))
+    # a per-request copy, so the shared model admin is not modified
+    model_admin = copy.copy(model_admin)
+    model_admin.get_changelist = lambda request, **kwargs: changelist_class
+    return model_admin.get_changelist_instance(request)
+
+
+def _unwrap_view(func):
+    """
+    Remove the decorators of a view, stopping at the as_view() function
+    (which is itself marked as wrapping dispatch() on older Django versions).
+    """
+    def is_view(f):
+        view_class = getattr(f, 'view_class', None)
+        return view_class is not None and f.__wrapped__ is view_class.dispatch
+    return inspect.unwrap(func, stop=is_view)
+
+
+def _get_prefix_search_admin(model_admin, request):
+    """
+    Return a per-request copy of model_admin searching its search fields by
+    prefix (istartswith), which can use an index, instead of icontains.
+    """
+    search_fields = [
+        name if name[:1] in '^=@' else '^' + name
+        for name in model_admin.get_search_fields(request)
+    ]
+    model_admin = copy.copy(model_admin)
+    model_admin.get_search_fields = lambda request: search_fields
+    return model_admin
+
+
+@contextmanager
+def _statement_timeout(using, milliseconds):
+    """
+    Cancel the queries run on the database using in the block when they take
+    more than milliseconds, raising OperationalError. Does nothing on other
+    backends than PostgreSQL, MySQL and SQLite.
+    """
+    connection = connections[using]
+    milliseconds = int(milliseconds)
+    if connection.vendor == 'postgresql':
+        # SET LOCAL only lasts until the end of the transaction
+        with transaction.atomic(using=using):
+            with connection.cursor() as cursor:
+                cursor.execute('SET LOCAL statement_timeout = %s', [milliseconds])
+            yield
+            # in case the block ran in a savepoint of an outer transaction
+            with connection.cursor() as cursor:
+                cursor.execute('SET LOCAL statement_timeout = DEFAULT')
+    elif connection.vendor == 'mysql':
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT @@SESSION.max_execution_time')
+            previous = cursor.fetchone()[0]
+            cursor.execute('SET SESSION max_execution_time = %s', [milliseconds])
+        try:
+            yield
+        finally:
+            with connection.cursor() as cursor:
+                cursor.execute('SET SESSION max_execution_time = %s', [previous])
+    elif connection.vendor == 'sqlite':
+        connection.ensure_connection()
+        deadline = time.monotonic() + milliseconds / 1000
+
+        def cancel():
+            return time.monotonic() > deadline
+
+        # called every 1000 virtual machine instructions; True interrupts
+        connection.connection.set_progress_handler(cancel, 1000)
+        try:
+            yield
+        finally:
+            connection.connection.set_progress_handler(None, 1000)
+    else:
+        yield
+
+
+def _value_matches(value, term, lookup):
+    """In-memory equivalent of the (i)exact, (i)startswith and (i)contains lookups."""
+    if lookup.startswith('i'):
+        value, term, lookup = value.casefold(), term.casefold(), lookup[1:]
+    if lookup == 'exact':
+        return value == term
+    if lookup == 'startswith':
+        return value.startswith(term)
+    if lookup == 'contains':
+        return term in value
+    raise ImproperlyConfigured('Snapshots cannot be searched with the %s lookup.' % lookup)
+
+
+def _encode_cursor(values):
+    """Serialize the ordering values of the last row into an opaque token."""
+    data = json.dumps(values, cls=DjangoJSONEncoder, separators=(',', ':'))
+    return base64.urlsafe_b64encode(data.encode()).decode()
+
+
+def _decode_cursor(cursor):
+    """Inverse of _encode_cursor; raises ValueError for malformed tokens."""
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode()).decode())
+    except (binascii.Error, UnicodeError, json.JSONDecodeError) as e:
+        raise ValueError('Invalid cursor.') from e
+    if not isinstance(values, list):
+        raise ValueError('Invalid cursor.')
+    return values
+
+
+def _keyset_filter(ordering, values):
+    """
+    Build (a > x) OR (a = x AND b > y) OR ... for the given ordering, flipping
+    the comparison for descending columns.
+    """
+    condition = Q()
+    for i, (name, desc) in enumerate(ordering):
+        lookups = {prev_name: prev_value for (prev_name, _), prev_value in zip(ordering[:i], values[:i])}
+        lookups['%s__%s' % (name, 'lt' if desc else 'gt')] = values[i]
+        condition |= Q(**lookups)
+    return condition
+
+
+def _lookup_value(obj, name):
+    """Follow a (possibly nested) lookup like 'author__name' on an instance."""
+    for attr in name.split(LOOKUP_SEP):
+        obj = getattr(obj, attr)
+    return obj
@@ -1,12 +1,20 @@
 """Defines the admin interface for the test app, including inlines and filters."""
 
+from django import VERSION as DJANGO_VERSION
 from django import forms
 from django.contrib import admin
+from django.contrib.auth.decorators import user_passes_test
 from django.shortcuts import reverse
 from django.urls import path
-from admin_auto_filters.filters import AutocompleteFilter, AutocompleteFilterFactory
+from admin_auto_filters.filters import (
+    AutocompleteFilter, AutocompleteFilterFactory, AutocompleteFilterMultiple, AutocompleteValueFilter,
+)
+from admin_auto_filters.mixins import BatchAutocompleteMixin, PartialRefreshMixin, ValuesAutocompleteMixin
 from .models import Food, Person, Collection, Book
-from .views import FoodsThatAreFavorites
+from .views import (
+    AsyncFoodNames, AsyncPeopleByCursor, BudgetedFoodNames, CachedFoodNames, FoodsThatAreFavorites, FoodsWithFavoriteCounts, FoodNames,
+    FoodNamesWithEtags, IndexedFoodNames, PeopleByCursor, TrigramFoodNames,
+)
 
 
 # hard code some user constants (must match fixture)
@@ -47,6 +55,8 @@ class FriendFilter(AutocompleteFilter):
     field_name = 'best_friend'
     rel_model = Person
     parameter_name = 'best_friend'
+    prefetch_options = 3
+    prefetch_by_usage = True
 
 
 class TwinFilter(AutocompleteFilter):
@@ -54,6 +64,8 @@ class TwinFilter(AutocompleteFilter):
     field_name = 'twin'
     rel_model = Person
     parameter_name = 'twin'
+    search_delay = 100
+    client_cache_size = 0
 
 
 class RevTwinFilter(AutocompleteFilter):
@@ -84,6 +96,28 @@ class SiblingsFilter(AutocompleteFilter):
     parameter_name = 'siblings'
 
 
+class SiblingsAnyFilter(AutocompleteFilterMultiple):
+    title = 'siblings, any of (manual)'
+    field_name = 'siblings'
+    rel_model = Person
+    parameter_name = 'siblings__in'
+    use_subquery = True
+
+
+class NameFilter(AutocompleteValueFilter):
+    title = 'name (values)'
+    field_name = 'name'
+    parameter_name = 'name'
+    scope_to_changelist = True
+
+
+class FriendNameFilter(AutocompleteValueFilter):
+    title = 'best friend\'s name (values)'
+    field_name = 'best_friend__name'
+    search_lookup = 'icontains'
+    snapshot_timeout = 60
+
+
 class FoodChoiceField(forms.ModelChoiceField):
     def label_from_instance(self, obj):
         return obj.alternate_name()
@@ -95,6 +129,7 @@ class FoodFilter(AutocompleteFilter):
     rel_model = Person
     parameter_name = 'favorite_food'
     form_field = FoodChoiceField
+    scope_to_changelist = True
 
     def get_autocomplete_url(self, request, model_admin):
         return reverse('admin:foods_that_are_favorites')
@@ -119,6 +154,7 @@ class RevPersonFoodFilter(AutocompleteFilter):
     field_name = 'favorite_food'
     rel_model = Person
     parameter_name = 'person__favorite_food'
+    use_subquery = True
 
 
 class RevCollectionFilter(AutocompleteFilter):
@@ -126,6 +162,7 @@ class RevCollectionFilter(AutocompleteFilter):
     field_name = 'collection'
     rel_model = Person
     parameter_name = 'collection'
+    use_subquery = True
 
 
 class AuthorFilter(AutocompleteFilter):
@@ -210,6 +247,39 @@ class FoodAdmin(CustomAdmin):
     readonly_fields = ['id']
     search_fields = ['id', 'name']
 
+    def get_urls(self):
+        urls = super().get_urls()
+        custom_urls = [
+            path('food_names/',
+                 self.admin_site.admin_view(FoodNames.as_view(model_admin=self)),
+                 name='food_names'),
+            path('cached_food_names/',
+                 self.admin_site.admin_view(CachedFoodNames.as_view(model_admin=self)),
+                 name='cached_food_names'),
+            path('food_names_with_etags/',
+                 self.admin_site.admin_view(FoodNamesWithEtags.as_view(model_admin=self), cacheable=True),
+                 name='food_names_with_etags'),
+            path('forbidden_food_names/',
+                 self.admin_site.admin_view(user_passes_test(lambda user: False)(FoodNames.as_view(model_admin=self))),
+                 name='forbidden_food_names'),
+            path('indexed_food_names/',
+                 self.admin_site.admin_view(IndexedFoodNames.as_view(model_admin=self)),
+                 name='indexed_food_names'),
+            path('trigram_food_names/',
+                 self.admin_site.admin_view(TrigramFoodNames.as_view(model_admin=self)),
+                 name='trigram_food_names'),
+            path('budgeted_food_names/',
+                 self.admin_site.admin_view(BudgetedFoodNames.as_view(model_admin=self)),
+                 name='budgeted_food_names'),
+            path('foods_with_favorite_counts/',
+                 self.admin_site.admin_view(FoodsWithFavoriteCounts.as_view(model_admin=self)),
+                 name='foods_with_favorite_counts'),
+        ]
+        if DJANGO_VERSION >= (4, 1):
+            custom_urls.append(path('async_food_names/', AsyncFoodNames.as_view(model_admin=self),
+                                    name='async_food_names'))
+        return custom_urls + urls
+
 
 @admin.register(Collection)
 class CollectionAdmin(CustomAdmin):
@@ -233,7 +303,7 @@ class CollectionAdmin(CustomAdmin):
 
 
 @admin.register(Person)
-class PersonAdmin(CustomAdmin):
+class PersonAdmin(BatchAutocompleteMixin, ValuesAutocompleteMixin, PartialRefreshMixin, CustomAdmin):
     autocomplete_fields = ['best_friend', 'twin', 'siblings', 'favorite_food', 'curated_collections']
     fields = ['id', 'name', 'best_friend', 'twin', 'siblings', 'favorite_food', 'curated_collections']
     inlines = [BookInline]
@@ -246,11 +316,14 @@ class PersonAdmin(CustomAdmin):
         FriendFriendFilter,
         FriendFoodFilter,
         SiblingsFilter,
+        SiblingsAnyFilter,
         FoodFilter,
         BestFriendOfFilter,
         AuthoredFilter,
         RevPersonFoodFilter,
         RevCollectionFilter,
+        NameFilter,
+        FriendNameFilter,
     ]
     list_filter_auto = [
         AutocompleteFilterFactory('best friend (auto)', 'best_friend'),
@@ -259,12 +332,17 @@ class PersonAdmin(CustomAdmin):
         AutocompleteFilterFactory('best friend\'s best friend (auto)', 'best_friend__best_friend'),
         AutocompleteFilterFactory('best friend\'s favorite food (auto)', 'best_friend__favorite_food'),
         AutocompleteFilterFactory('siblings (auto)', 'siblings'),
-        AutocompleteFilterFactory('food (auto)', 'favorite_food', viewname='admin:foods_that_are_favorites', label_by='alternate_name'),
+        AutocompleteFilterFactory('siblings, any of (auto)', 'siblings', use_subquery=True, multiple=True),
+        AutocompleteFilterFactory('food (auto)', 'favorite_food', viewname='admin:foods_that_are_favorites',
+                                  label_by='alternate_name', scope_to_changelist=True),
         AutocompleteFilterFactory('best friend of (auto)', 'person'),
         AutocompleteFilterFactory('authored (auto)', 'book'),
-        AutocompleteFilterFactory('best friend of person with fav food (auto)', 'person__favorite_food'),
-        AutocompleteFilterFactory('collections as curator (auto)', 'collection'),
+        AutocompleteFilterFactory('best friend of person with fav food (auto)', 'person__favorite_food',
+                                  use_subquery=True),
+        AutocompleteFilterFactory('collections as curator (auto)', 'collection', use_subquery=True),
         # AutocompleteFilterFactory('curated_collections (auto)', 'curated_collections'),  # does not work...
+        NameFilter,
+        FriendNameFilter,
     ]
     ordering = ['id']
     readonly_fields = ['id']
@@ -277,7 +355,13 @@ class PersonAdmin(CustomAdmin):
             path('foods_that_are_favorites/',
                  self.admin_site.admin_view(FoodsThatAreFavorites.as_view(model_admin=self)),
                  name='foods_that_are_favorites'),
+            path('people_by_cursor/',
+                 self.admin_site.admin_view(PeopleByCursor.as_view(model_admin=self)),
+                 name='people_by_cursor'),
         ]
+        if DJANGO_VERSION >= (4, 1):
+            custom_urls.append(path('async_people_by_cursor/', AsyncPeopleByCursor.as_view(model_admin=self),
+                                    name='async_people_by_cursor'))
         return custom_urls + urls
 
 
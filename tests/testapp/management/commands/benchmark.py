@@ -0,0 +1,276 @@
+"""
+Benchmark the filters and autocomplete endpoints of the test app on generated data.
+
+Run e.g. `./tests_manage.py benchmark --rows 100000 --output bench.json` from
+the base directory. A separate test database is created (on the configured
+database, so Postgres is used if TEST_DB_ENGINE selects it), seeded, measured
+and destroyed. Pass --compare with a previous output to print the ratios.
+"""
+
+import json
+import platform
+import random
+import statistics
+import sys
+import time
+from contextlib import ExitStack, redirect_stdout
+from itertools import islice
+from django import VERSION as DJANGO_VERSION
+from django.conf import settings
+from django.contrib import admin
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connection, connections, transaction
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import reverse
+from admin_auto_filters.db import get_database
+from tests.testapp.admin import BASIC_USERNAME, SHORTCUT_USERNAME
+from tests.testapp.models import Food, Collection, Person, Book
+
+
+SYLLABLES = ('ka', 'lo', 'mi', 'ne', 'ru', 'sa', 'ti', 'vo', 'ze', 'an', 'el', 'or')
+BATCH_SIZE = 5000
+
+# endpoints measured besides the default autocomplete view of each model admin
+CUSTOM_ENDPOINTS = ('people_by_cursor', 'food_names', 'foods_with_favorite_counts', 'foods_that_are_favorites')
+
+
+def make_name(rng):
+    return ''.join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4))).capitalize()
+
+
+def bulk_insert(model, rows):
+    """Insert the instances of the iterable rows, BATCH_SIZE at a time."""
+    rows = iter(rows)
+    while True:
+        batch = list(islice(rows, BATCH_SIZE))
+        if not batch:
+            break
+        model.objects.bulk_create(batch)
+
+
+@transaction.atomic
+def seed(rows, seed=0):
+    """
+    Replace the test app data with rows people, and foods, collections and books
+    in proportion, covering every relation shape the filters use (FK, reverse
+    FK, O2O, M2M, nested paths). Foreign key checks are deferred to the end of
+    the transaction, so rows can reference rows inserted later.
+    """
+    rng = random.Random(seed)
+    for model in (Book, Person.siblings.through, Collection.curators.through, Collection, Person, Food):
+        model.objects.all().delete()
+    n_foods = max(rows // 100, 10)
+    n_collections = max(rows // 100, 10)
+    n_books = max(rows // 10, 10)
+
+    def some(count, rate=0.8):
+        return rng.randint(1, count) if rng.random() < rate else None
+
+    def sibling_pairs():
+        """
+        Pair each person with the one offset places after, both ways as the
+        relation is symmetrical. Unless the offset is half of rows, (i, i + offset)
+        never equals (j + offset, j), so no pair is generated twice.
+        """
+        if rows < 3:
+            return
+        offset = rng.randint(1, rows - 1)
+        if 2 * offset == rows:
+            offset -= 1
+        for i in range(1, rows + 1):
+            j = (i - 1 + offset) % rows + 1
+            yield i, j
+            yield j, i
+
+    def curator_pairs():
+        """A random collection for one person out of each ten, so no pair repeats."""
+        for start in range(0, rows - rows % 10, 10):
+            yield rng.randint(1, n_collections), start + rng.randint(1, 10)
+
+    bulk_insert(Food, (Food(id=i, name=make_name(rng)) for i in range(1, n_foods + 1)))
+    bulk_insert(Collection, (Collection(id=i, name=make_name(rng)) for i in range(1, n_collections + 1)))
+    bulk_insert(Person, (
+        Person(
+            id=i,
+            name=make_name(rng),
+            best_friend_id=some(rows),
+            # pairs (1, 2), (3, 4)... are twins, one way
+            twin_id=i + 1 if i % 2 and i < rows and rng.random() < 0.2 else None,
+            favorite_food_id=some(n_foods),
+            least_favorite_food_id=some(n_foods, 0.5),
+            favorite_book_id=some(n_books, 0.3),
+        )
+        for i in range(1, rows + 1)
+    ))
+    bulk_insert(Book, (
+        Book(isbn=i, title=make_name(rng), author_id=some(rows), coll_id=some(n_collections))
+        for i in range(1, n_books + 1)
+    ))
+    bulk_insert(Person.siblings.through, (
+        Person.siblings.through(from_person_id=i, to_person_id=j) for i, j in sibling_pairs()
+    ))
+    bulk_insert(Collection.curators.through, (
+        Collection.curators.through(collection_id=i, person_id=j) for i, j in curator_pairs()
+    ))
+    return {'food': n_foods, 'collection': n_collections, 'person': rows, 'book': n_books}
+
+
+def measure(client, url, params, repeat):
+    """
+    Return the status, query count and timings in ms of GET url. Queries are
+    counted on the default database and on ADMIN_AUTO_FILTERS_DATABASE.
+    """
+    aliases = {DEFAULT_DB_ALIAS, get_database() or DEFAULT_DB_ALIAS}
+    timings = []
+    for _ in range(repeat):
+        with ExitStack() as stack:
+            captures = [stack.enter_context(CaptureQueriesContext(connections[alias])) for alias in aliases]
+            start = time.perf_counter()
+            response = client.get(url, params)
+            if hasattr(response, 'render'):
+                response.render()
+            timings.append((time.perf_counter() - start) * 1000)
+    return {
+        'status': response.status_code,
+        'queries': sum(len(queries) for queries in captures),
+        'median_ms': round(statistics.median(timings), 3),
+        'min_ms': round(min(timings), 3),
+    }, response
+
+
+def bench_changelists(client, repeat, label):
+    """Render each changelist unfiltered, then filtered by each of its filters."""
+    results = []
+    for model in (Food, Collection, Person, Book):
+        model_admin = admin.site._registry[model]
+        url = reverse('admin:%s_%s_changelist' % (model._meta.app_label, model._meta.model_name))
+        list_filter = model_admin.list_filter if label == 'manual' else model_admin.list_filter_auto
+        filters = [None] + [spec.parameter_name for spec in list_filter]
+        for parameter_name in filters:
+            params = {parameter_name: '1'} if parameter_name else {}
+            result, _ = measure(client, url, params, repeat)
+            result.update(kind='changelist', target=model._meta.model_name, filters=label, params=params)
+            results.append(result)
+    return results
+
+
+def bench_endpoints(client, repeat, terms, pages):
+    """Search each endpoint by term length and page depth."""
+    results = []
+    if DJANGO_VERSION >= (3, 2):
+        # the admin site's view, searching the model of a person's field
+        endpoints = [
+            (reverse('admin:autocomplete'), {'app_label': 'testapp', 'model_name': 'person', 'field_name': name})
+            for name in ('favorite_food', 'curated_collections', 'best_friend')
+        ]
+    else:
+        endpoints = [
+            (reverse('admin:%s_%s_autocomplete' % (model._meta.app_label, model._meta.model_name)), {})
+            for model in (Food, Collection, Person)
+        ]
+    endpoints += [(reverse('admin:%s' % name), {}) for name in CUSTOM_ENDPOINTS]
+    for url, source in endpoints:
+        for term in terms:
+            cursor = None
+            for page in range(1, max(pages) + 1):
+                params = dict(source, term=term, page=page)
+                if cursor:
+                    params['cursor'] = cursor
+                if page in pages:
+                    result, response = measure(client, url, params, repeat)
+                    result.update(kind='endpoint', target=url, params=dict(source, term=term, page=page))
+                    results.append(result)
+                else:
+                    response = client.get(url, params)
+                if response.status_code != 200 or not response.json()['pagination']['more']:
+                    break
+                cursor = response.json()['pagination'].get('next')
+    return results
+
+
+def result_key(result):
+    return json.dumps([result['kind'], result['target'], result.get('filters'), result['params']], sort_keys=True)
+
+
+class Command(BaseCommand):
+    help = 'Benchmark changelist filters and autocomplete endpoints on generated data.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=10000, help='Number of people (default: 10000).')
+        parser.add_argument('--seed', type=int, default=0, help='Random seed of the generated data.')
+        parser.add_argument('--repeat', type=int, default=5, help='Measurements per request (default: 5).')
+        parser.add_argument('--pages', default='1,5,20', help='Comma-separated page depths (default: 1,5,20).')
+        parser.add_argument('--output', help='Write the JSON results to this file instead of stdout.')
+        parser.add_argument('--compare', help='Print the ratio of median times to a previous output.')
+        parser.add_argument('--keepdb', action='store_true', help='Keep the benchmark database.')
+        parser.add_argument('--existing-db', action='store_true',
+                            help='Use the current database instead of creating one (its test app data is replaced).')
+
+    def handle(self, *args, **options):
+        # the test client's host
+        with override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver']):
+            if options['existing_db']:
+                report = self.run(options)
+            else:
+                old_name = connection.settings_dict['NAME']
+                # keep the output of the data migration out of the report
+                with redirect_stdout(sys.stderr):
+                    connection.creation.create_test_db(verbosity=0, autoclobber=True, keepdb=options['keepdb'])
+                try:
+                    report = self.run(options)
+                finally:
+                    connection.creation.destroy_test_db(old_name, verbosity=0, keepdb=options['keepdb'])
+        output = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                f.write(output)
+        else:
+            self.stdout.write(output)
+        if options['compare']:
+            self.compare(report, options['compare'])
+
+    def run(self, options):
+        try:
+            pages = sorted({int(page) for page in options['pages'].split(',')})
+        except ValueError as e:
+            raise CommandError('--pages must be comma-separated integers.') from e
+        start = time.perf_counter()
+        counts = seed(options['rows'], options['seed'])
+        seed_seconds = time.perf_counter() - start
+        terms = [''] + [SYLLABLES[0].capitalize()[:1], SYLLABLES[0], SYLLABLES[0] + SYLLABLES[1]]
+        results = []
+        for username, label in ((BASIC_USERNAME, 'manual'), (SHORTCUT_USERNAME, 'auto')):
+            client = Client()
+            client.force_login(User.objects.get(username=username))
+            results += bench_changelists(client, options['repeat'], label)
+            if label == 'manual':
+                results += bench_endpoints(client, options['repeat'], terms, pages)
+        return {
+            'meta': {
+                'rows': counts,
+                'seed': options['seed'],
+                'repeat': options['repeat'],
+                'seed_seconds': round(seed_seconds, 3),
+                'database': connection.vendor,
+                'django': '.'.join(str(part) for part in DJANGO_VERSION[:3]),
+                'python': platform.python_version(),
+            },
+            'results': results,
+        }
+
+    def compare(self, report, path):
+        with open(path) as f:
+            previous = {result_key(result): result for result in json.load(f)['results']}
+        for result in report['results']:
+            old = previous.get(result_key(result))
+            if old is None or not old['median_ms']:
+                continue
+            self.stderr.write('%6.2fx %+4d queries  %s %s %s\n' % (
+                result['median_ms'] / old['median_ms'],
+                result['queries'] - old['queries'],
+                result['kind'],
+                result['target'],
+                json.dumps(result['params'], sort_keys=True),
+            ), ending='')
@@ -5,7 +5,7 @@ from django.db import migrations
 
 
 def load_fixture(apps, schema_editor):
-    call_command('loaddata', 'fixture', app_label='testapp')
+    call_command('loaddata', 'fixture', app_label='testapp', database=schema_editor.connection.alias)
 
 
 def unload_fixture(apps, schema_editor):
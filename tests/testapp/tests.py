@@ -1,14 +1,31 @@
 """Define tests for the test app."""
 
+import io
 import json
+from contextlib import contextmanager
+from unittest import skipUnless
+from django import VERSION as DJANGO_VERSION
+from django.conf import settings
+from django.contrib import admin
 from django.contrib.admin.utils import flatten
-from django.contrib.auth.models import User
+from django.contrib.auth.models import Permission, User
 from django.core import exceptions
-from django.test import TestCase, tag
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import CommandError, call_command
+from django.db import connection, connections
+from django.db.models.signals import class_prepared
+from django.test import RequestFactory, TestCase, tag
+from django.test.utils import CaptureQueriesContext, override_settings
 from django.urls import reverse
+from django.utils import translation
+from django.utils.html import escape
 from admin_auto_filters import filters
-from tests.testapp.admin import BASIC_USERNAME, SHORTCUT_USERNAME
+from admin_auto_filters.cache import get_cache, get_model_version
+from admin_auto_filters.instrumentation import phase_timed
+from tests.testapp.admin import BASIC_USERNAME, SHORTCUT_USERNAME, FriendFilter
 from tests.testapp.models import Food, Collection, Person, Book
+from tests.testapp.views import AsyncFoodNames, FoodNames, FoodNamesWithEtags, FoodsWithFavoriteCounts, PeopleByCursor
+from admin_auto_filters.views import AutocompleteValuesView
 
 
 def name(model):
@@ -35,10 +52,15 @@ FILTER_STRINGS = (
     (Person, 'best_friend__best_friend', '1', 'id', (4,)),
     (Person, 'best_friend__favorite_food', '1', 'id', (4,)),
     (Person, 'siblings', '2', 'id', (1, 3, 4)),
+    (Person, 'siblings__in', '2', 'id', (1, 3, 4)),
+    (Person, 'siblings__in', '1,3', 'id', (2,)),
+    (Person, 'siblings__in', '1,2', 'id', (1, 2, 3, 4)),
     (Person, 'favorite_food', '3', 'id', (3, 4)),
     (Person, 'person', '3', 'id', (1,)),
     (Person, 'book', '1111', 'id', (4,)),
     (Person, 'person__favorite_food', '3', 'id', (1,2)),
+    (Person, 'name', 'Bob', 'id', (2,)),
+    (Person, 'best_friend__name', 'Alice', 'id', (2, 3)),
     (Person, 'collection', '1', 'id', (1, 2)),
     (Book, 'author', '2', 'isbn', (42,)),
     (Book, 'coll', '2', 'isbn', (2357,)),
@@ -46,8 +68,26 @@ FILTER_STRINGS = (
 )
 
 
+@contextmanager
+def committed(using='default'):
+    """
+    Run the on_commit() callbacks registered in the block, as if its
+    transaction committed; TestCase never commits.
+    """
+    callbacks = connections[using].run_on_commit
+    start = len(callbacks)
+    try:
+        yield
+    finally:
+        registered = callbacks[start:]
+        del callbacks[start:]
+        for callback in registered:
+            callback[1]()
+
+
 class RootTestCase(object):
     # fixtures = ['fixture.json']  # loading from data migration 0002
+    databases = {'default', 'replica'}
 
     @classmethod
     def setUpTestData(cls):
@@ -67,6 +107,310 @@ class RootTestCase(object):
         self.assertIn('SPAM', texts, msg=str(texts))
         self.assertIn('TOAST', texts, msg=str(texts))
 
+    def test_endpoint_cursor_pagination(self):
+        """
+        Test that the cursor paginated endpoint pages through all rows in order.
+        """
+        url = reverse('admin:people_by_cursor')
+        ids, params = [], {}
+        for _ in range(Person.objects.count()):
+            response = self.client.get(url, params, follow=False)
+            self.assertEqual(response.status_code, 200, msg=str(url))
+            data = json.loads(response.content)
+            self.assertLessEqual(len(data['results']), 2, msg=str(data))
+            ids.extend(int(item['id']) for item in data['results'])
+            if not data['pagination']['more']:
+                self.assertNotIn('next', data['pagination'])
+                break
+            params = {'cursor': data['pagination']['next'], 'page': 2}
+        self.assertEqual(ids, list(Person.objects.order_by('id').values_list('id', flat=True)))
+        response = self.client.get(url, {'cursor': 'not-a-cursor'}, follow=False)
+        self.assertEqual(response.status_code, 400, msg=str(url))
+        # a random ordering is a configuration error, not a bad request
+        self.assertRaises(ImproperlyConfigured, PeopleByCursor().get_cursor_ordering, Person.objects.order_by('?'))
+
+    def test_endpoint_label_fields(self):
+        """
+        Test that the endpoint builds labels from label_fields without loading instances.
+        """
+        url = reverse('admin:food_names')
+        response = self.client.get(url, {'term': 'to'}, follow=False)
+        self.assertEqual(response.status_code, 200, msg=str(url))
+        data = json.loads(response.content)
+        self.assertEqual(data['results'], [
+            {'id': '3', 'text': '3 Toast'},
+            {'id': '4', 'text': '4 Tomatoes'},
+        ])
+
+    def test_endpoint_cache(self):
+        """
+        Test that cached responses are reused, and invalidated when the model changes.
+        """
+        get_cache().clear()
+        url = reverse('admin:cached_food_names')
+
+        def get_texts():
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(url, {'term': 'to'}, follow=False)
+            self.assertEqual(response.status_code, 200, msg=str(url))
+            texts = [item['text'] for item in json.loads(response.content)['results']]
+            return texts, len(queries)
+
+        texts, cold_queries = get_texts()
+        self.assertEqual(texts, ['3 Toast', '4 Tomatoes'])
+        texts, warm_queries = get_texts()
+        self.assertEqual(texts, ['3 Toast', '4 Tomatoes'])
+        self.assertLess(warm_queries, cold_queries)
+        with committed():
+            Food.objects.get(pk=3).delete()
+        texts, _ = get_texts()
+        self.assertEqual(texts, ['4 Tomatoes'])
+        get_cache().clear()
+
+    def test_cache_m2m_invalidation(self):
+        """
+        Test that m2m changes bump the versions of both sides on commit, limited to ADMIN_AUTO_FILTERS_CACHED_MODELS.
+        """
+        get_cache().clear()
+        collection = Collection.objects.get(pk=1)
+        versions = {model: get_model_version(model) for model in (Collection, Person)}
+        with committed():
+            collection.curators.add(2)
+            # not before the transaction commits
+            self.assertEqual(get_model_version(Collection), versions[Collection])
+        self.assertGreater(get_model_version(Collection), versions[Collection])
+        self.assertGreater(get_model_version(Person), versions[Person])
+        versions = {model: get_model_version(model) for model in (Collection, Person)}
+        with override_settings(ADMIN_AUTO_FILTERS_CACHED_MODELS=['testapp.person']):
+            with committed():
+                collection.curators.remove(2)
+        self.assertEqual(get_model_version(Collection), versions[Collection])
+        self.assertGreater(get_model_version(Person), versions[Person])
+        with override_settings(ADMIN_AUTO_FILTERS_CACHED_MODELS=['testapp.person']):
+            self.assertRaises(ImproperlyConfigured, get_model_version, Collection)
+        get_cache().clear()
+
+    @skipUnless(DJANGO_VERSION >= (4, 1), 'the async ORM requires Django 4.1')
+    def test_endpoint_async(self):
+        """
+        Test that the async views answer like the sync ones.
+        """
+        for name, params in (
+            ('food_names', {'term': 'to'}),
+            ('food_names', {'term': 'to', 'page': 2}),
+            ('people_by_cursor', {}),
+        ):
+            expected = self.client.get(reverse('admin:%s' % name), params, follow=False)
+            response = self.client.get(reverse('admin:async_%s' % name), params, follow=False)
+            self.assertEqual(response.status_code, expected.status_code, msg=name)
+            if expected.status_code == 200:
+                self.assertEqual(response.json(), expected.json(), msg=name)
+        url = reverse('admin:async_people_by_cursor')
+        cursor = self.client.get(url, follow=False).json()['pagination']['next']
+        response = self.client.get(url, {'cursor': cursor}, follow=False)
+        self.assertEqual([item['text'] for item in response.json()['results']], ['Carol', 'David'])
+        self.client.logout()
+        response = self.client.get(reverse('admin:async_food_names'), follow=False)
+        self.assertEqual(response.status_code, 403)
+
+    @skipUnless(DJANGO_VERSION < (4, 1), 'the async ORM requires Django 4.1')
+    def test_endpoint_async_unsupported(self):
+        """
+        Test that the async views cannot be used without the async ORM.
+        """
+        self.assertRaises(ImproperlyConfigured, AsyncFoodNames.as_view, model_admin=admin.site._registry[Food])
+
+    def test_endpoint_async_budget_options(self):
+        """
+        Test that the async views refuse the options they do not apply.
+        """
+        for name, value in (('statement_timeout', 500), ('scan_limit', 1000), ('prefix_first', True)):
+            with self.subTest(name=name):
+                with self.assertRaisesMessage(ImproperlyConfigured, 'does not support %s' % name):
+                    AsyncFoodNames.as_view(model_admin=admin.site._registry[Food], **{name: value})
+
+    def test_endpoint_etags(self):
+        """
+        Test that matching conditional requests get a 304 without running the search.
+        """
+        url = reverse('admin:food_names_with_etags')
+        request = RequestFactory().get(url, {'term': 'to'})
+        request.user = self.user
+        view = FoodNamesWithEtags.as_view(model_admin=admin.site._registry[Food])
+        # the version stamps of the per-process default cache can stay stale forever
+        self.assertRaises(ImproperlyConfigured, view, request)
+        with override_settings(ADMIN_AUTO_FILTERS_CACHE='shared'):
+            get_cache().clear()
+            self._test_endpoint_etags(url)
+            get_cache().clear()
+
+    def _test_endpoint_etags(self, url):
+        response = self.client.get(url, {'term': 'to'}, follow=False)
+        self.assertEqual(response.status_code, 200, msg=str(url))
+        etag = response['ETag']
+        self.assertIn('no-cache', response['Cache-Control'])
+        self.assertNotIn('no-store', response['Cache-Control'])
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, {'term': 'to'}, follow=False, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+        self.assertFalse([query for query in queries if 'testapp_food' in query['sql']])
+        response = self.client.get(url, {'term': 'eggs'}, follow=False, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        with committed():
+            Food.objects.get(pk=3).save()
+        response = self.client.get(url, {'term': 'to'}, follow=False, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_endpoint_query_budget(self):
+        """
+        Test that short terms, slow searches and searches past scan_limit degrade to a keep_typing response.
+        """
+        url = reverse('admin:budgeted_food_names')
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, {'term': 't'}, follow=False)
+        self.assertEqual(response.status_code, 200, msg=str(url))
+        self.assertEqual(json.loads(response.content), {
+            'results': [], 'pagination': {'more': False}, 'keep_typing': True,
+        })
+        self.assertFalse([query for query in queries if 'testapp_food' in query['sql']])
+        data = json.loads(self.client.get(url, {'term': 'to'}, follow=False).content)
+        self.assertEqual([item['text'] for item in data['results']], ['3 Toast', '4 Tomatoes'])
+        self.assertNotIn('keep_typing', data)
+        # the contains search times out, the prefix search still finds Tomatoes
+        data = json.loads(self.client.get(url, {'term': 'tom', 'slow': '1'}, follow=False).content)
+        self.assertEqual([item['text'] for item in data['results']], ['4 Tomatoes'])
+        self.assertTrue(data['keep_typing'])
+        data = json.loads(self.client.get(url, {'term': 'tom', 'slow': '2'}, follow=False).content)
+        self.assertEqual(data, {'results': [], 'pagination': {'more': False}, 'keep_typing': True})
+        # past scan_limit rows, terms are searched by prefix
+        get_cache().clear()
+        view = FoodNames.as_view(model_admin=admin.site._registry[Food], scan_limit=3)
+        for term, expected, checks in (('tomatoes', ['4 Tomatoes'], 1), ('matoes', [], 0)):
+            request = RequestFactory().get(url, {'term': term})
+            request.user = self.user
+            with CaptureQueriesContext(connection) as queries:
+                data = json.loads(view(request).content)
+            self.assertEqual([item['text'] for item in data['results']], expected)
+            self.assertTrue(data['keep_typing'])
+            # the row count check is cached
+            self.assertEqual(len([query for query in queries if 'OFFSET 3' in query['sql']]), checks)
+        view = FoodNames.as_view(model_admin=admin.site._registry[Food], scan_limit=100)
+        request = RequestFactory().get(url, {'term': 'matoes'})
+        request.user = self.user
+        data = json.loads(view(request).content)
+        self.assertEqual([item['text'] for item in data['results']], ['4 Tomatoes'])
+        self.assertNotIn('keep_typing', data)
+
+    def test_endpoint_search_backend(self):
+        """
+        Test that views with an index search backend search the index, kept up to date by triggers.
+        """
+        stdout = io.StringIO()
+        call_command('build_search_index', stdout=stdout)
+        self.assertIn('Build: testapp.Food (SQLiteFTS5Backend)', stdout.getvalue())
+        self.assertIn('Skipping testapp.Food: PostgresSearchBackend', stdout.getvalue())
+        url = reverse('admin:indexed_food_names')
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, {'term': 'to'}, follow=False)
+        self.assertEqual(response.status_code, 200, msg=str(url))
+        data = json.loads(response.content)
+        self.assertEqual([item['text'] for item in data['results']], ['3 Toast', '4 Tomatoes'])
+        self.assertTrue([query for query in queries if 'MATCH' in query['sql']])
+        # quotes are not FTS5 syntax errors
+        data = json.loads(self.client.get(url, {'term': 'tom "'}, follow=False).content)
+        self.assertEqual([item['text'] for item in data['results']], ['4 Tomatoes'])
+        Food.objects.create(id=6, name='Tofu')
+        Food.objects.filter(id=3).update(name='Bread')
+        data = json.loads(self.client.get(url, {'term': 'to'}, follow=False).content)
+        self.assertEqual([item['text'] for item in data['results']], ['4 Tomatoes', '6 Tofu'])
+        call_command('refresh_search_index', 'testapp.food', stdout=stdout)
+        # falls back to the model admin search on SQLite
+        data = json.loads(self.client.get(reverse('admin:trigram_food_names'), {'term': 'ofu'}).content)
+        self.assertEqual([item['text'] for item in data['results']], ['6 Tofu'])
+        self.assertRaises(CommandError, call_command, 'build_search_index', 'testapp.person', stdout=stdout)
+
+    def test_endpoint_prefix_first(self):
+        """
+        Test that prefix matches come first, exact matches at the top, and the full search only fills the page.
+        """
+        def search(term, page=1, paginate_by=2):
+            request = RequestFactory().get('/', {'term': term, 'page': page})
+            request.user = self.user
+            view = FoodNames.as_view(model_admin=admin.site._registry[Food], prefix_first=True,
+                                     paginate_by=paginate_by)
+            data = json.loads(view(request).content)
+            return [item['text'] for item in data['results']], data['pagination']['more']
+
+        self.assertEqual(search('e'), (['2 Eggs', '4 Tomatoes'], True))
+        self.assertEqual(search('e', page=2), (['5 Coffee'], False))
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(search('to', paginate_by=1), (['3 Toast'], True))
+        self.assertEqual(len([query for query in queries if 'testapp_food' in query['sql']]), 1)
+        Food.objects.create(id=6, name='Tomato')
+        self.assertEqual(search('tomato'), (['6 Tomato', '4 Tomatoes'], False))
+
+    def test_endpoint_facet_counts(self):
+        """
+        Test that facet counts are computed in one query, and left out above facet_limit.
+        """
+        url = reverse('admin:foods_with_favorite_counts')
+        response = self.client.get(url, follow=False)
+        self.assertEqual(response.status_code, 200, msg=str(url))
+        counts = {item['text']: item['count'] for item in json.loads(response.content)['results']}
+        self.assertEqual(counts, {'Spam': 1, 'Eggs': 0, 'Toast': 2, 'Tomatoes': 0, 'Coffee': 0})
+        request = RequestFactory().get(url)
+        request.user = self.user
+        with CaptureQueriesContext(connection) as queries:
+            view = FoodsWithFavoriteCounts.as_view(model_admin=admin.site._registry[Food], facet_limit=2)
+            response = view(request)
+        self.assertEqual(len([q for q in queries if 'GROUP BY' in q['sql']]), 1)
+        for item in json.loads(response.content)['results']:
+            self.assertNotIn('count', item)
+        # scoped, only the rows of the filtered changelist are counted
+        params = {'scope_model': 'testapp.person', 'scope_lookup': 'favorite_food', 'scope': 'best_friend=1'}
+        response = self.client.get(url, params, follow=False)
+        counts = {item['text']: item['count'] for item in json.loads(response.content)['results']}
+        self.assertEqual(counts, {'Spam': 1, 'Toast': 1})
+
+    def test_endpoint_scope(self):
+        """
+        Test that scoped requests only return values referenced by the filtered changelist.
+        """
+        url = reverse('admin:food_names')
+        params = {'scope_model': 'testapp.person', 'scope_lookup': 'favorite_food'}
+        for scope, texts in (('', ['1 Spam', '3 Toast']),
+                             ('best_friend=1', ['1 Spam', '3 Toast']),
+                             ('best_friend=2', ['3 Toast']),
+                             ('q=spam', ['1 Spam'])):
+            with self.subTest(scope=scope):
+                response = self.client.get(url, dict(params, scope=scope), follow=False)
+                self.assertEqual(response.status_code, 200, msg=str(url))
+                self.assertEqual([item['text'] for item in json.loads(response.content)['results']], texts)
+        for lookup in ('', 'name', 'name__startswith__x'):
+            with self.subTest(scope_lookup=lookup):
+                response = self.client.get(url, dict(params, scope_lookup=lookup), follow=False)
+                self.assertEqual(response.status_code, 400, msg=str(url))
+
+    def test_endpoint_scope_cache(self):
+        """
+        Test that the values referenced by a scope can be cached.
+        """
+        get_cache().clear()
+        params = {'scope_model': 'testapp.person', 'scope_lookup': 'favorite_food', 'scope': 'best_friend=2'}
+        view = FoodNames.as_view(model_admin=admin.site._registry[Food], scope_cache_timeout=60)
+        query_counts = []
+        for _ in range(2):
+            request = RequestFactory().get('/', params)
+            request.user = self.user
+            with CaptureQueriesContext(connection) as queries:
+                response = view(request)
+            self.assertEqual([item['text'] for item in json.loads(response.content)['results']], ['3 Toast'])
+            query_counts.append(len([q for q in queries if 'testapp_person' in q['sql']]))
+        self.assertEqual(query_counts, [1, 0])
+        get_cache().clear()
+
     def test_admin_changelist_search(self):
         """
         Test that the admin changelist page loads with a search query, at a basic level.
@@ -115,6 +459,279 @@ class RootTestCase(object):
                         html=True, msg_prefix=str(url)
                     )
 
+    def test_admin_changelist_filters_batch_labels(self):
+        """
+        Test that selected labels of filters on the same related model are fetched in one query.
+        """
+        url = reverse('admin:testapp_person_changelist') + '?best_friend=1&twin=1&siblings=2'
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, follow=False)
+        self.assertEqual(response.status_code, 200, msg=str(url))
+        self.assertContains(response, '<option value="1" selected>Alice</option>', count=2, html=True)
+        self.assertContains(response, '<option value="2" selected>Bob</option>', count=1, html=True)
+        label_queries = [q['sql'] for q in queries if '"testapp_person"."id" IN' in q['sql']]
+        self.assertEqual(len(label_queries), 1, msg=str(label_queries))
+
+    def test_changelist_instance_lazy_widgets(self):
+        """
+        Test that building a changelist without rendering it builds no widgets.
+        """
+        for model in MODELS:
+            with self.subTest(model_name=name(model)):
+                request = RequestFactory().get('/', {'twin': '1'} if model is Person else {})
+                request.user = self.user
+                cl = admin.site._registry[model].get_changelist_instance(request)
+                self.assertTrue(cl.filter_specs)
+                for spec in cl.filter_specs:
+                    self.assertNotIn('_widget', vars(spec))
+                    self.assertNotIn('_field', vars(spec))
+                    self.assertNotIn('rendered_widget', vars(spec))
+
+    def test_filter_use_subquery(self):
+        """
+        Test that filters with use_subquery filter through a subquery, not a join.
+        """
+        request = RequestFactory().get('/', {'collection': '1', 'person__favorite_food': '3', 'siblings__in': '1,3'})
+        request.user = self.user
+        cl = admin.site._registry[Person].get_changelist_instance(request)
+        specs = [spec for spec in cl.filter_specs if spec.use_subquery]
+        self.assertEqual(len(specs), 3)
+        for spec in specs:
+            with self.subTest(parameter_name=spec.parameter_name):
+                qs = spec.queryset(request, Person.objects.all())
+                outer = str(qs.query).split(' WHERE ')[0]
+                self.assertNotIn('JOIN', outer)
+                self.assertIn('IN (SELECT', str(qs.query))
+
+    def test_admin_media(self):
+        """
+        Test that filter media is added to the admin class once, not on every request.
+        """
+        url = reverse('admin:testapp_person_changelist')
+        model_admin = admin.site._registry[Person]
+        self.client.get(url, follow=False)
+        media_property = type(model_admin).__dict__['media']
+        response = self.client.get(url, follow=False)
+        self.assertIs(type(model_admin).__dict__['media'], media_property)
+        for path in ('custom.css', 'autocomplete-fix.css', 'autocomplete_filter_qs.js'):
+            self.assertIn(path, str(model_admin.media))
+            self.assertContains(response, path)
+        # the select2 translation follows the active language
+        for language in ('de', 'fr'):
+            with translation.override(language):
+                self.assertIn('select2/i18n/%s.js' % language, str(model_admin.media))
+
+    def test_relation_cache(self):
+        """
+        Test that relation metadata is resolved once, and cleared when models are prepared.
+        """
+        filters.clear_relation_cache()
+        for _ in range(2):
+            self.assertIs(filters._get_rel_model(Person, 'best_friend__favorite_food'), Person)
+        self.assertEqual(filters._get_rel_model.cache_info().hits, 1)
+        class_prepared.send(sender=Person)
+        self.assertEqual(filters._get_rel_model.cache_info().currsize, 0)
+
+    def test_generate_choice_field(self):
+        """
+        Test that labelled choice field classes are created once per label_item.
+        """
+        field_class = filters.generate_choice_field('alternate_name')
+        self.assertIs(filters.generate_choice_field('alternate_name'), field_class)
+        field = field_class(queryset=Food.objects.all())
+        self.assertEqual(field.label_from_instance(Food(name='spam')), 'SPAM')
+        field = filters.generate_choice_field('name')(queryset=Food.objects.all())
+        self.assertEqual(field.label_from_instance(Food(name='spam')), 'spam')
+        field = filters.generate_choice_field('not_a_field')(queryset=Food.objects.all())
+        self.assertRaises(ValueError, field.label_from_instance, Food(name='spam'))
+
+    def test_admin_changelist_filter_multiple(self):
+        """
+        Test that a multiple value filter restores all labels and returns each row once.
+        """
+        url = reverse('admin:testapp_person_changelist') + '?siblings__in=1,3'
+        response = self.client.get(url, follow=False)
+        self.assertEqual(response.status_code, 200, msg=str(url))
+        self.assertContains(response, '<option value="1" selected>Alice</option>', count=1, html=True)
+        self.assertContains(response, '<option value="3" selected>Carol</option>', count=1, html=True)
+        self.assertContains(response, '<td class="field-id">2</td>', count=1, html=True)
+        # invalid values are reported like other bad lookups, not as a server error
+        url = reverse('admin:testapp_person_changelist') + '?siblings__in=abc,1'
+        response = self.client.get(url, follow=False)
+        self.assertEqual(response.status_code, 302, msg=str(url))
+        self.assertTrue(response['Location'].endswith('?e=1'))
+
+    def test_admin_changelist_filter_client_attrs(self):
+        """
+        Test that the search delay and client cache size are rendered on the widgets.
+        """
+        url = reverse('admin:testapp_person_changelist')
+        response = self.client.get(url, follow=False)
+        self.assertContains(response, 'data-cache-size="50"')
+        self.assertContains(response, 'data-ajax--delay="250"')
+        if self.user == self.basic_user:
+            self.assertContains(response, 'data-cache-size="0"', count=1)
+            self.assertContains(response, 'data-ajax--delay="100"', count=1)
+
+    def test_admin_changelist_fragment(self):
+        """
+        Test that admins with PartialRefreshMixin answer fragment requests with #changelist only.
+        """
+        url = reverse('admin:testapp_person_changelist') + '?best_friend=1'
+        response = self.client.get(url, follow=False)
+        self.assertContains(response, 'data-partial-refresh="true"')
+        self.assertContains(response, 'id="user-tools"')
+        self.assertIn('X-Changelist-Fragment', response['Vary'])
+        response = self.client.get(url, follow=False, HTTP_X_CHANGELIST_FRAGMENT='1')
+        self.assertContains(response, 'id="changelist"')
+        self.assertContains(response, '<td class="field-id">3</td>', html=True)
+        self.assertNotContains(response, 'id="user-tools"')
+        self.assertNotContains(response, 'id="nav-sidebar"')
+        self.assertNotContains(response, 'autocomplete_filter_qs.js')
+        response = self.client.get(reverse('admin:testapp_food_changelist'), follow=False)
+        self.assertNotContains(response, 'data-partial-refresh')
+
+    def test_admin_autocomplete_batch(self):
+        """
+        Test that the batch endpoint answers the queries of several filters in one request.
+        """
+        url = reverse('admin:testapp_person_changelist')
+        batch_url = reverse('admin:testapp_person_autocomplete_batch')
+        response = self.client.get(url, follow=False)
+        self.assertContains(response, 'data-batch-url="%s"' % batch_url)
+        if DJANGO_VERSION >= (3, 2):
+            admin_query = {'url': reverse('admin:autocomplete'), 'data': {
+                'term': 'ali', 'app_label': 'testapp', 'model_name': 'person', 'field_name': 'best_friend',
+            }}
+        else:
+            admin_query = {'url': reverse('admin:testapp_person_autocomplete'), 'data': {'term': 'ali'}}
+        queries = [
+            dict(admin_query, id='a'),
+            {'id': 'b', 'url': reverse('admin:people_by_cursor'), 'data': {'term': '', 'page': 1}},
+            {'id': 'c', 'url': reverse('admin:foods_that_are_favorites') + '?term=spam'},
+            {'id': 'd', 'url': reverse('admin:logout')},
+            {'id': 'e', 'url': '/not/a/url/'},
+            # the view's own decorators still apply
+            {'id': 'f', 'url': reverse('admin:forbidden_food_names')},
+        ]
+        response = self.client.get(batch_url, {'queries': json.dumps(queries)})
+        self.assertEqual(response.status_code, 200)
+        responses = response.json()['responses']
+        self.assertEqual([r['id'] for r in responses], ['a', 'b', 'c', 'd', 'e', 'f'])
+        self.assertEqual([r['status'] for r in responses], [200, 200, 200, 404, 404, 302])
+        for query, answer in zip(queries[:3], responses):
+            self.assertEqual(answer['data'], self.client.get(query['url'], query.get('data')).json())
+        self.assertEqual([r['id'] for r in responses[1]['data']['results']], ['1', '2'])
+        self.assertTrue(self.client.session.session_key)  # not logged out
+        for queries in ('', '{}', '[1]', json.dumps([{'url': '/'}] * 21)):
+            response = self.client.get(batch_url, {'queries': queries})
+            self.assertEqual(response.status_code, 400, msg=queries)
+
+    def test_admin_changelist_filter_scope(self):
+        """
+        Test that filters with scope_to_changelist pass the other active filters to their endpoint.
+        """
+        url = reverse('admin:testapp_person_changelist') + '?best_friend=2&favorite_food=3'
+        response = self.client.get(url, follow=False)
+        self.assertEqual(response.status_code, 200, msg=str(url))
+        self.assertContains(
+            response,
+            'data-ajax--url="%s?scope_model=testapp.person&amp;scope_lookup=favorite_food&amp;scope=best_friend%%3D2"'
+            % reverse('admin:foods_that_are_favorites'),
+        )
+
+    def test_admin_changelist_filter_values(self):
+        """
+        Test that value filters render their selection and search distinct values by keyset, snapshot and scope.
+        """
+        get_cache().clear()
+        response = self.client.get(reverse('admin:testapp_person_changelist'), {'name': 'Bob'}, follow=False)
+        self.assertContains(response, '<option value="Bob" selected>Bob</option>', html=True)
+        url = reverse('admin:testapp_person_autocomplete_values')
+        self.assertContains(response, '%s?field=name&amp;scope=' % url)
+
+        def search(params, **initkwargs):
+            request = RequestFactory().get(url, params)
+            request.user = self.user
+            view = AutocompleteValuesView.as_view(model_admin=admin.site._registry[Person], **initkwargs)
+            response = view(request)
+            self.assertEqual(response.status_code, 200, msg=str(params))
+            data = json.loads(response.content)
+            return [item['text'] for item in data['results']], data['pagination']
+
+        texts, pagination = search({'field': 'name'}, paginate_by=2)
+        self.assertEqual((texts, pagination['more']), (['Alice', 'Bob'], True))
+        texts, pagination = search({'field': 'name', 'cursor': pagination['next'], 'page': 2}, paginate_by=2)
+        self.assertEqual(texts, ['Carol', 'David'])
+        self.assertEqual(search({'field': 'name', 'term': 'c'})[0], ['Carol'])
+        self.assertEqual(search({'field': 'name', 'scope': 'best_friend=1'})[0], ['Bob', 'Carol'])
+        self.assertEqual(search({'field': 'best_friend__name'})[0], ['Alice', 'Bob'])
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(search({'field': 'best_friend__name', 'term': 'LI'})[0], ['Alice'])
+        self.assertFalse([query for query in queries if 'testapp_person' in query['sql']])
+        response = self.client.get(url, {'field': 'twin'}, follow=False)
+        self.assertEqual(response.status_code, 400)
+        queries = [{'id': 0, 'url': url, 'data': {'field': 'name', 'term': 'd'}}]
+        response = self.client.get(reverse('admin:testapp_person_autocomplete_batch'), {'queries': json.dumps(queries)})
+        self.assertEqual(json.loads(response.content)['responses'][0]['data']['results'],
+                         [{'id': 'David', 'text': 'David'}])
+
+    def test_database_routing(self):
+        """
+        Test that label, option and search queries go to the ADMIN_AUTO_FILTERS_DATABASE alias.
+        """
+        url = reverse('admin:testapp_person_changelist') + '?best_friend=2'
+        with override_settings(ADMIN_AUTO_FILTERS_DATABASE='replica'):
+            with CaptureQueriesContext(connections['replica']) as replica:
+                response = self.client.get(url, follow=False)
+            self.assertContains(response, '<option value="2" selected>Bob</option>', html=True)
+            self.assertTrue([query for query in replica if 'testapp_person' in query['sql']])
+            with CaptureQueriesContext(connection) as default, CaptureQueriesContext(connections['replica']) as replica:
+                response = self.client.get(reverse('admin:food_names'), {'term': 'to'}, follow=False)
+            self.assertEqual(len(response.json()['results']), 2)
+            self.assertFalse([query for query in default if 'testapp_food' in query['sql']])
+            self.assertTrue([query for query in replica if 'testapp_food' in query['sql']])
+        self.assertEqual(filters.get_database('other'), 'other')
+
+    def test_instrumentation(self):
+        """
+        Test that filter and endpoint phases are timed, and reported in the Server-Timing header.
+        """
+        url = reverse('admin:testapp_person_changelist') + '?best_friend=1'
+        response = self.client.get(url, follow=False)
+        self.assertFalse(response.has_header('Server-Timing'))
+        timed = []
+
+        def receiver(sender, name, duration, queries, request, **kwargs):
+            timed.append((sender, name, queries))
+
+        phase_timed.connect(receiver)
+        middleware = settings.MIDDLEWARE + ['admin_auto_filters.instrumentation.ServerTimingMiddleware']
+        try:
+            with override_settings(ADMIN_AUTO_FILTERS_INSTRUMENTATION=True, MIDDLEWARE=middleware):
+                # a new client, as the middleware of a client is loaded once
+                self.client = self.client_class()
+                self.client.force_login(self.user)
+                response = self.client.get(url, follow=False)
+                header = response['Server-Timing']
+                if self.user == self.basic_user:
+                    self.assertIn('best_friend.init;dur=', header)
+                    self.assertIn('best_friend.queryset;dur=', header)
+                    self.assertIn('best_friend.render;dur=', header)
+                    self.assertIn((FriendFilter, 'best_friend.queryset', 0), timed)
+                response = self.client.get(reverse('admin:foods_with_favorite_counts'), follow=False)
+                header = response['Server-Timing']
+                for phase in ('search', 'paginate', 'serialize', 'facets'):
+                    self.assertIn('autocomplete.%s;dur=' % phase, header)
+                self.assertIn((FoodsWithFavoriteCounts, 'autocomplete.facets', 1), timed)
+                # the search query runs in the search phase, the count in the paginate phase
+                self.assertIn((FoodsWithFavoriteCounts, 'autocomplete.search', 1), timed)
+                self.assertIn((FoodsWithFavoriteCounts, 'autocomplete.paginate', 1), timed)
+        finally:
+            phase_timed.disconnect(receiver)
+        response = self.client.get(url, follow=False)
+        self.assertFalse(response.has_header('Server-Timing'))
+
     def test_get_queryset_for_field(self):
         """
         Test the AutocompleteFilter.get_queryset_for_field method.
@@ -143,10 +760,61 @@ class RootTestCase(object):
 @tag('basic')
 class BasicTestCase(RootTestCase, TestCase):
     def setUp(self):
+        self.user = self.basic_user
         self.client.force_login(self.basic_user)
 
+    def test_admin_changelist_filter_prefetch(self):
+        """
+        Test that filters with prefetch_options embed the most used options the user may see.
+        """
+        get_cache().clear()
+        url = reverse('admin:testapp_person_changelist')
+        options = [{'id': '1', 'text': 'Alice'}, {'id': '2', 'text': 'Bob'}]
+        for _ in range(2):
+            response = self.client.get(url, follow=False)
+            self.assertContains(response, escape(json.dumps(options)), count=1)
+        Person.objects.filter(pk__in=(2, 3)).update(best_friend=4)
+        with committed():
+            Person.objects.get(pk=1).save()  # invalidate
+        response = self.client.get(url, follow=False)
+        options = [{'id': '4', 'text': 'David'}, {'id': '2', 'text': 'Bob'}]
+        self.assertContains(response, escape(json.dumps(options)), count=1)
+        model_admin = admin.site._registry[Person]
+        request = RequestFactory().get(url)
+        request.user = User.objects.create_user('viewer', is_staff=True)
+        self.assertEqual(FriendFilter(request, {}, Person, model_admin).get_prefetched_options(), [])
+        request.user.user_permissions.add(Permission.objects.get(codename='view_person'))
+        request.user = User.objects.get(pk=request.user.pk)  # reload the permissions
+        self.assertEqual(FriendFilter(request, {}, Person, model_admin).get_prefetched_options(), options)
+
+        class CustomEndpointFilter(FriendFilter):
+            def get_autocomplete_url(self, request, model_admin):
+                return reverse('admin:people_by_cursor')
+
+        self.assertFalse(CustomEndpointFilter(request, {}, Person, model_admin).use_prefetched_options())
+        get_cache().clear()
+
 
 @tag('shortcut')
 class ShortcutTestCase(RootTestCase, TestCase):
     def setUp(self):
+        self.user = self.shortcut_user
         self.client.force_login(self.shortcut_user)
+
+
+@tag('benchmark')
+class BenchmarkTestCase(TestCase):
+    def test_benchmark_command(self):
+        """
+        Test that the benchmark command seeds the data and reports every request.
+        """
+        out = io.StringIO()
+        call_command('benchmark', rows=50, repeat=1, pages='1,2', existing_db=True, stdout=out)
+        report = json.loads(out.getvalue())
+        self.assertEqual(report['meta']['rows']['person'], 50)
+        self.assertEqual(Person.objects.count(), 50)
+        self.assertTrue(Person.siblings.through.objects.exists())
+        kinds = {result['kind'] for result in report['results']}
+        self.assertEqual(kinds, {'changelist', 'endpoint'})
+        for result in report['results']:
+            self.assertEqual(result['status'], 200, msg=str(result))
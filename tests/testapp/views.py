@@ -1,8 +1,9 @@
 """Defines custom autocompletion views for the test app."""
 
 from django.db.models import Q
-from admin_auto_filters.views import AutocompleteJsonView
-from .models import Food
+from admin_auto_filters.search import PostgresSearchBackend, SQLiteFTS5Backend
+from admin_auto_filters.views import AsyncAutocompleteJsonView, AutocompleteJsonView
+from .models import Food, Person
 
 
 class FoodsThatAreFavorites(AutocompleteJsonView):
@@ -24,3 +25,81 @@ class FoodsThatAreFavorites(AutocompleteJsonView):
             qs = qs.filter(Q(id__icontains=bit) | Q(name__icontains=bit))
         qs = qs.order_by('name')  #.distinct()
         return qs
+
+
+class PeopleByCursor(AutocompleteJsonView):
+    """List people using keyset pagination, two at a time."""
+
+    cursor_pagination = True
+    paginate_by = 2
+
+
+class FoodNames(AutocompleteJsonView):
+    """List foods from a values_list() query, labelled as '<id> <name>'."""
+
+    label_fields = ('id', 'name')
+
+
+class CachedFoodNames(FoodNames):
+    """FoodNames, with responses kept in the shared cache."""
+
+    cache_timeout = 60
+
+
+class AsyncFoodNames(AsyncAutocompleteJsonView):
+    """FoodNames, served asynchronously."""
+
+    label_fields = ('id', 'name')
+
+
+class AsyncPeopleByCursor(AsyncAutocompleteJsonView):
+    """PeopleByCursor, served asynchronously."""
+
+    cursor_pagination = True
+    paginate_by = 2
+
+
+class FoodNamesWithEtags(FoodNames):
+    """FoodNames, answering conditional requests."""
+
+    use_etags = True
+
+
+class IndexedFoodNames(FoodNames):
+    """FoodNames, searching a full-text index of the names."""
+
+    search_backend = SQLiteFTS5Backend()
+
+
+class TrigramFoodNames(FoodNames):
+    """FoodNames, searching a trigram index of the names on PostgreSQL."""
+
+    search_backend = PostgresSearchBackend(mode='trigram')
+
+
+class BudgetedFoodNames(FoodNames):
+    """
+    FoodNames with a query budget. With ?slow=1 the full search is made slow
+    (the prefix search is not), with ?slow=2 both are.
+    """
+
+    min_term_length = 2
+    statement_timeout = 50
+
+    def get_queryset(self):
+        qs = super().get_queryset()
+        slow = self.request.GET.get('slow')
+        prefix_search = all(name.startswith('^') for name in self.model_admin.get_search_fields(self.request))
+        if slow == '2' or (slow == '1' and not prefix_search):
+            qs = qs.extra(where=[
+                '(WITH RECURSIVE c(x) AS (SELECT 1 UNION ALL SELECT x + 1 FROM c WHERE x < 100000000) '
+                'SELECT count(*) FROM c) > 0'
+            ])
+        return qs
+
+
+class FoodsWithFavoriteCounts(AutocompleteJsonView):
+    """List foods, with the number of people having each as favorite."""
+
+    facet_model = Person
+    facet_lookup = 'favorite_food'
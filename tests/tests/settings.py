@@ -5,6 +5,7 @@ Generated by 'django-admin startproject' using Django 2.2.7.
 """
 
 import os
+import tempfile
 from django.core.management.utils import get_random_secret_key
 
 BASE_DIR = os.path.dirname(
@@ -64,6 +65,23 @@ DATABASES = {
     }
 }
 
+# e.g. TEST_DB_ENGINE=django.db.backends.postgresql TEST_DB_NAME=autocomplete_filter
+if os.environ.get('TEST_DB_ENGINE'):
+    DATABASES['default'] = {
+        'ENGINE': os.environ['TEST_DB_ENGINE'],
+        'NAME': os.environ.get('TEST_DB_NAME', 'admin_auto_filters'),
+        'USER': os.environ.get('TEST_DB_USER', ''),
+        'PASSWORD': os.environ.get('TEST_DB_PASSWORD', ''),
+        'HOST': os.environ.get('TEST_DB_HOST', ''),
+        'PORT': os.environ.get('TEST_DB_PORT', ''),
+    }
+
+# a second database standing in for a read replica; tests load the same data in it
+if os.environ.get('TEST_DB_ENGINE'):
+    DATABASES['replica'] = dict(DATABASES['default'], NAME=DATABASES['default']['NAME'] + '_replica')
+else:
+    DATABASES['replica'] = dict(DATABASES['default'], NAME=os.path.join(BASE_DIR, 'replica.sqlite3'))
+
 AUTH_PASSWORD_VALIDATORS = []
 
 LANGUAGE_CODE = 'en-us'
@@ -81,3 +99,17 @@ STATIC_URL = '/static/'
 STATICFILES_DIRS = [
     os.path.join(BASE_DIR, "tests", "static"),
 ]
+
+# the models whose autocomplete results the tests cache
+ADMIN_AUTO_FILTERS_CACHED_MODELS = ['testapp.food', 'testapp.collection', 'testapp.person', 'testapp.book']
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    # a cache shared between processes, which ETags require
+    'shared': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.path.join(tempfile.gettempdir(), 'admin_auto_filters_tests'),
+    },
+}